@@ -0,0 +1,180 @@
+import argparse
+import csv
+import json
+import os
+import platform
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import date, datetime, timedelta
+from itertools import islice
+
+from hostel_core import HEADER, Ledger, export_month, filter_range, write_bill_sheet
+
+SIZES = [10_000, 100_000, 1_000_000]
+REPORT_PATH = "bench_report.json"
+TABLE_WINDOW = 35  # rows a virtual table materializes (visible rows plus buffer)
+
+RELIGIONS = ["Hindu", "Muslim", "Aboriginal"]
+FIRST_NAMES = ["Emon", "Abdul", "Rahim", "Karim", "Nusrat", "Tania", "Sakib", "Mitu", "Rafi", "Joya"]
+LAST_NAMES = ["Aziz", "Hossain", "Das", "Roy", "Islam", "Ahmed", "Khan", "Chakma", "Sarker", "Paul"]
+
+# ------------------- Synthetic Ledger -------------------
+def generate_ledger(path, rows, seed=0, students=None):
+    # A ledger shaped like student_expense.csv: every student eats most days,
+    # "No" prayers carry the extra meal, and the one-time costs appear on
+    # each student's first row of a month.
+    rng = random.Random(seed)
+    students = students or max(50, min(2000, rows // 300))
+    people = []
+    for roll in range(1, students + 1):
+        name = f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}"
+        people.append((str(roll), name, rng.choice(RELIGIONS)))
+    days = max(1, rows // students)
+    start = date.today() - timedelta(days=days)
+    billed = set()
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(HEADER)
+        serial = 0
+        while serial < rows:
+            day = start + timedelta(days=serial // students)
+            roll, name, religion = people[serial % students]
+            serial += 1
+            prayer = "Yes" if rng.random() < 0.85 else "No"
+            meals = rng.randint(1, 3) + (prayer == "No")
+            rate = rng.choice([30.0, 35.0, 40.0])
+            month = (roll, day.year, day.month)
+            fixed = (1200.0, 100.0, 100.0) if month not in billed else (0.0, 0.0, 0.0)
+            billed.add(month)
+            writer.writerow([serial, roll, name, day.isoformat(), religion, prayer,
+                             meals, rate * meals, *fixed])
+    return students
+
+# ------------------- Timing -------------------
+def best_of(repeat, func):
+    # Fastest of repeat runs; the minimum is the least noisy estimate
+    best = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+def bench_size(rows, storage, repeat, workdir):
+    folder = os.path.join(workdir, f"{storage}_{rows}")
+    shutil.rmtree(folder, ignore_errors=True)
+    os.makedirs(folder)
+    path = os.path.join(folder, "student_expense.csv")
+    started = time.perf_counter()
+    students = generate_ledger(path, rows)
+    results = {"rows": rows, "students": students, "generate": time.perf_counter() - started}
+
+    # The first load may convert the CSV (sqlite, partitioned), so it is timed apart
+    started = time.perf_counter()
+    Ledger(path, storage).load().close()
+    results["first_load"] = time.perf_counter() - started
+    results["load"] = best_of(repeat, lambda: Ledger(path, storage).load().close())
+
+    ledger = Ledger(path, storage).load()
+    ledger.load_months()  # time the full ledger in every storage mode
+    last = date.fromordinal(max(rec.day for rec in ledger.records.values()))
+    year, month = last.year, last.month
+    rolls = [str(roll) for roll in random.Random(1).sample(range(1, students + 1), min(50, students))]
+    day_from, day_to, _ = filter_range(month_text=str(month), year_text=str(year))
+
+    def cold_summaries():
+        ledger.summaries.clear()
+        for roll in rolls:
+            ledger.student_summary(roll, day_from, day_to)
+
+    def warm_summaries():
+        for roll in rolls:
+            ledger.student_summary(roll, day_from, day_to)
+
+    def row_summaries():
+        # An arbitrary range is never served from the cache
+        for roll in rolls:
+            ledger.student_summary(roll, day_from + 1, day_to)
+
+    results["save"] = best_of(repeat, ledger.save)
+    results["summary_cold"] = best_of(repeat, cold_summaries) / len(rolls)
+    results["summary_cached"] = best_of(repeat, warm_summaries) / len(rolls)
+    results["summary_rows"] = best_of(repeat, row_summaries) / len(rolls)
+    export_path = os.path.join(folder, "export.csv")
+    results["export_month"] = best_of(repeat, lambda: export_month(ledger, year, month, export_path))
+    bill_path = os.path.join(folder, "bills.csv")
+    results["bill_month"] = best_of(repeat, lambda: write_bill_sheet(ledger, year, month, bill_path))
+    results["overall_totals"] = best_of(repeat, lambda: (ledger.category_totals(), ledger.student_count()))
+    # What update_table() computes per row, without a display to draw on
+    results["table_full"] = best_of(repeat, lambda: [rec.to_row() for rec in ledger.records.values()])
+    middle = len(ledger.records) // 2
+    results["table_virtual"] = best_of(repeat, lambda: [rec.to_row() for rec in islice(
+        ledger.records.values(), middle, middle + TABLE_WINDOW)])
+    ledger.close()
+    shutil.rmtree(folder, ignore_errors=True)
+    return results
+
+# ------------------- Report -------------------
+def git_revision():
+    try:
+        out = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                             cwd=os.path.dirname(os.path.abspath(__file__)), timeout=5)
+    except (OSError, subprocess.SubprocessError):
+        return None
+    return out.stdout.strip() or None
+
+def compare(report, baseline):
+    # Prints new/old time per operation; above 1.0 is slower than the baseline
+    old = {(entry["storage"], entry["rows"]): entry for entry in baseline["results"]}
+    for entry in report["results"]:
+        base = old.get((entry["storage"], entry["rows"]))
+        if base is None:
+            continue
+        print(f"{entry['storage']} {entry['rows']} rows vs {baseline.get('revision') or 'baseline'}:")
+        for name, seconds in entry.items():
+            if name in ("rows", "students", "storage") or not base.get(name):
+                continue
+            print(f"  {name:16} {seconds * 1000:12.3f}ms  x{seconds / base[name]:.2f}")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the ledger on synthetic data")
+    parser.add_argument("--sizes", type=int, nargs="+", default=SIZES, help="rows per run (default: %(default)s)")
+    parser.add_argument("--storage", nargs="+", default=["journal"],
+                        choices=["journal", "csv", "sqlite", "partitioned"])
+    parser.add_argument("--repeat", type=int, default=3, help="runs per operation, the best is kept")
+    parser.add_argument("-o", "--output", default=REPORT_PATH, help="JSON report (default: %(default)s)")
+    parser.add_argument("--compare", help="an earlier report to compare against")
+    parser.add_argument("--workdir", help="where synthetic ledgers are written (default: a temp folder)")
+    args = parser.parse_args(argv)
+
+    workdir = args.workdir or tempfile.mkdtemp(prefix="hostel_bench_")
+    report = {"created": datetime.now().strftime("%Y-%m-%d %H:%M:%S"), "revision": git_revision(),
+              "python": platform.python_version(), "platform": platform.platform(),
+              "repeat": args.repeat, "unit": "seconds", "results": []}
+    try:
+        for storage in args.storage:
+            for rows in args.sizes:
+                print(f"{storage}: {rows} rows...", file=sys.stderr, flush=True)
+                entry = {"storage": storage, **bench_size(rows, storage, args.repeat, workdir)}
+                report["results"].append(entry)
+                print(" ".join(f"{name}={value * 1000:.3f}ms" for name, value in entry.items()
+                               if isinstance(value, float)), file=sys.stderr)
+    finally:
+        if not args.workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"Report written to {args.output}")
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            compare(report, json.load(f))
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
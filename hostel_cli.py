@@ -0,0 +1,220 @@
+import argparse
+import csv
+import sys
+import time
+from datetime import date
+
+import hostel_trends
+from hostel_core import (CHANGES_DIR, FILE_PATH, MAX_USUAL_MEALS, Ledger, build_expense, export_all,
+                         export_changes, export_month, filter_range, meal_count_warning, month_range, parse_day,
+                         write_bill_sheet)
+
+# Columns read by "import"; MealRate is the per-meal price (the form's "Meal
+# Expenses"). Date, MealRate and the one-time costs may be left out.
+IMPORT_COLUMNS = ["Roll", "Student", "Religion", "PrayerDone", "MealCount",
+                  "MealRate", "Hostel", "Electricity", "Inventory", "Date"]
+
+# ------------------- Commands -------------------
+def cmd_import(ledger, args):
+    default_day = parse_day(args.date) if args.date else None
+    records, errors, high = [], [], 0
+    started = time.perf_counter()
+    with open(args.file, newline="", encoding="utf-8") as f:
+        for line_no, row in enumerate(csv.DictReader(f), start=2):
+            try:
+                day = parse_day(row["Date"]) if row.get("Date") else default_day
+                rec = build_expense(row.get("Roll"), row.get("Student"), row.get("Religion"),
+                                    row.get("PrayerDone"), row.get("MealCount"),
+                                    row.get("MealRate") or args.meal_rate, row.get("Hostel"),
+                                    row.get("Electricity"), row.get("Inventory"), day)
+            except ValueError as exc:
+                errors.append(f"line {line_no}: {exc}")
+                continue
+            if meal_count_warning(row.get("MealCount")) is not None:
+                high += 1
+            records.append(rec)
+
+    for error in errors:
+        print(error, file=sys.stderr)
+    if errors and not args.skip_invalid:
+        print(f"{len(errors)} invalid rows, nothing imported (use --skip-invalid to import the rest)",
+              file=sys.stderr)
+        return 1
+    ledger.insert_many(records)  # one save for the whole batch
+    elapsed = time.perf_counter() - started
+    print(f"Imported {len(records)} records in {elapsed:.2f}s")
+    if high:
+        print(f"Note: {high} records have a meal count above {MAX_USUAL_MEALS}")
+    return 0
+
+def cmd_summary(ledger, args):
+    try:
+        day_from, day_to, month_only = filter_range(args.date or "", args.month or "", args.year or "",
+                                                    args.date_from or "", args.date_to or "")
+    except ValueError as exc:
+        print(exc, file=sys.stderr)
+        return 1
+    summary = ledger.student_summary(args.roll, day_from, day_to, month_only)
+    if summary is None:
+        print("No data found for the given filter!")
+        return 1
+    print(f"Name: {summary['student']}")
+    print(f"Roll: {args.roll}")
+    print(f"Records: {summary['records']}")
+    for label, key in [("Meal Total", "mess"), ("Hostel", "hostel"), ("Electricity", "electricity"),
+                       ("Inventory", "inventory"), ("Penalty", "penalty"), ("Total", "total")]:
+        print(f"{label}: {summary[key]:.2f} BDT")
+    return 0
+
+def cmd_export(ledger, args):
+    try:
+        path, count = export_month(ledger, args.year, args.month, args.output)
+    except ValueError:
+        print("Enter valid Month and Year!", file=sys.stderr)
+        return 1
+    print(f"Exported {count} records to {path}")
+    return 0
+
+def cmd_bill(ledger, args):
+    started = time.perf_counter()
+    try:
+        path, bills = write_bill_sheet(ledger, args.year, args.month, args.output)
+    except ValueError:
+        print("Enter valid Month and Year!", file=sys.stderr)
+        return 1
+    elapsed = time.perf_counter() - started
+    total = sum(bill["total"] for bill in bills)
+    print(f"Billed {len(bills)} students, {total:.2f} BDT in total, to {path} in {elapsed:.2f}s")
+    return 0
+
+def cmd_export_all(ledger, args):
+    shown = {"percent": -1}
+
+    def show_progress(done, total):
+        percent = done * 100 // max(total, 1)
+        if percent != shown["percent"]:
+            shown["percent"] = percent
+            print(f"\rExported {done}/{total} rows ({percent}%)", end="", file=sys.stderr, flush=True)
+
+    stats = export_all(ledger, args.out_dir, months=not args.no_months, students=not args.no_students,
+                       compress=args.gzip, workers=args.workers, progress=show_progress)
+    print(file=sys.stderr)
+    print(f"Wrote {stats['files']} files ({stats['rows']} rows) to {args.out_dir} "
+          f"in {stats['seconds']:.2f}s, {stats['rows_per_sec']:.0f} rows/s")
+    return 0
+
+def cmd_export_changes(ledger, args):
+    batch = export_changes(ledger, args.out_dir)
+    if batch is None:
+        print("Nothing changed since the last export")
+        return 0
+    kind = "Full export" if batch["kind"] == "full" else "Changes"
+    print(f"{kind}: {batch['upserts']} rows, {batch['deletes']} deletions to "
+          f"{args.out_dir}/{batch['file']} in {batch['seconds']:.2f}s")
+    return 0
+
+def cmd_trends(ledger, args):
+    try:
+        data = hostel_trends.TrendData(ledger).refresh()
+    except RuntimeError as exc:
+        print(exc, file=sys.stderr)
+        return 1
+    label = hostel_trends.METRICS[args.metric]
+    months, monthly = hostel_trends.monthly_series(data, args.metric, args.roll)
+    if not len(months):
+        print("No data found for the given filter!")
+        return 1
+    print(f"{label} by month ({f'roll {args.roll}' if args.roll else 'whole hostel'}):")
+    change = hostel_trends.month_over_month(monthly)
+    for month, total, pct in list(zip(months, monthly, change))[-args.months:]:
+        shown = "" if pct != pct else f"{pct:+.1f}%"  # NaN when the month before had nothing
+        print(f"  {hostel_trends.month_label(month)}  {total:>12.2f}  {shown:>9}")
+
+    days, daily = hostel_trends.daily_series(data, args.metric, args.roll)
+    average = hostel_trends.rolling_mean(daily, args.window)
+    print(f"\nLast {args.days} days ({args.window}-day average):")
+    for day, total, mean in list(zip(days, daily, average))[-args.days:]:
+        print(f"  {date.fromordinal(int(day))}  {total:>10.2f}  {mean:>10.2f}")
+
+    if not args.roll:
+        latest = hostel_trends.month_label(months[-1])
+        day_from, day_to = month_range(*map(int, latest.split("-")))
+        print(f"\nTop {args.top} by {label.lower()} in {latest}:")
+        for roll, total in hostel_trends.top_consumers(data, args.metric, args.top, day_from, day_to):
+            name = (ledger.student_info(roll) or ("",))[0]
+            print(f"  {roll:>8}  {name:24}  {total:>10.2f}")
+    return 0
+
+# ------------------- Entry Point -------------------
+def build_parser():
+    parser = argparse.ArgumentParser(description="Hostel & Mess Management System (command line)")
+    parser.add_argument("--ledger", default=FILE_PATH, help="ledger CSV (default: %(default)s)")
+    parser.add_argument("--storage", choices=["journal", "csv", "sqlite", "partitioned"],
+                        help="storage mode (default: HOSTEL_STORAGE or journal)")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    p = commands.add_parser("import", help="add a batch of meal entries from a CSV file")
+    p.add_argument("file", help="CSV with columns " + ", ".join(IMPORT_COLUMNS))
+    p.add_argument("--date", help="date for rows without a Date column (default: today)")
+    p.add_argument("--meal-rate", default="0", help="per-meal price for rows without MealRate")
+    p.add_argument("--skip-invalid", action="store_true", help="import the valid rows even if some fail")
+    p.set_defaults(func=cmd_import)
+
+    p = commands.add_parser("summary", help="expense summary for one student")
+    p.add_argument("roll")
+    p.add_argument("--date", help="YYYY-MM-DD")
+    p.add_argument("--month", help="1-12")
+    p.add_argument("--year", help="YYYY")
+    p.add_argument("--from", dest="date_from", help="YYYY-MM-DD")
+    p.add_argument("--to", dest="date_to", help="YYYY-MM-DD")
+    p.set_defaults(func=cmd_summary)
+
+    p = commands.add_parser("export", help="export one month to CSV")
+    p.add_argument("year", type=int)
+    p.add_argument("month", type=int)
+    p.add_argument("-o", "--output", help="output file (default: export_<year>_<month>.csv)")
+    p.set_defaults(func=cmd_export)
+
+    p = commands.add_parser("bill", help="month-end bill sheet for every student")
+    p.add_argument("year", type=int)
+    p.add_argument("month", type=int)
+    p.add_argument("-o", "--output", help="output file (default: bills_<year>_<month>.csv)")
+    p.set_defaults(func=cmd_bill)
+
+    p = commands.add_parser("export-all", help="export every month and a statement per student")
+    p.add_argument("out_dir", help="folder for months/ and students/")
+    p.add_argument("--gzip", action="store_true", help="write .csv.gz files")
+    p.add_argument("--workers", type=int, help="worker processes (default: one per CPU, 1 = no pool)")
+    p.add_argument("--no-months", action="store_true", help="skip the per-month files")
+    p.add_argument("--no-students", action="store_true", help="skip the per-student statements")
+    p.set_defaults(func=cmd_export_all)
+
+    p = commands.add_parser("export-changes", help="export the rows added, edited or deleted since the last run")
+    p.add_argument("out_dir", nargs="?", default=CHANGES_DIR, help="batch folder (default: %(default)s)")
+    p.set_defaults(func=cmd_export_changes)
+
+    p = commands.add_parser("trends", help="monthly and daily trends, month-over-month change, top consumers")
+    p.add_argument("--roll", help="one student (default: the whole hostel)")
+    p.add_argument("--metric", choices=list(hostel_trends.METRICS), default="meals")
+    p.add_argument("--months", type=int, default=12, help="months shown (default: %(default)s)")
+    p.add_argument("--days", type=int, default=14, help="days shown (default: %(default)s)")
+    p.add_argument("--window", type=int, default=hostel_trends.ROLLING_DAYS,
+                   help="rolling average in days (default: %(default)s)")
+    p.add_argument("--top", type=int, default=hostel_trends.TOP_N, help="(default: %(default)s)")
+    p.set_defaults(func=cmd_trends)
+    return parser
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    try:
+        ledger = Ledger(args.ledger, args.storage).load()
+    except ValueError as exc:
+        print(exc, file=sys.stderr)  # unreadable rows; nothing was changed
+        return 1
+    try:
+        return args.func(ledger, args)
+    finally:
+        ledger.close()
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,1948 @@
+import csv
+import gzip
+import hashlib
+import io
+import json
+import os
+import shutil
+import sqlite3
+import sys
+import threading
+import time
+from bisect import bisect_left, insort
+from calendar import monthrange
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, as_completed, wait
+from datetime import date, datetime
+
+from hostel_perf import timed
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+FILE_PATH = "student_expense.csv"
+HEADER = ["Serial", "Roll", "Student", "Date", "Religion", "PrayerDone",
+          "MealCount", "Mess", "Hostel", "Electricity", "Inventory"]
+CATEGORIES = ["Mess", "Hostel", "Electricity", "Inventory"]
+
+# "journal" appends every add/edit/delete to the .journal file next to the CSV
+# and folds it back into the CSV every COMPACT_EVERY changes; "csv" rewrites the
+# CSV each time; "sqlite" keeps the ledger in a .db file (imported from the CSV
+# on first use); "partitioned" keeps one CSV per month in a _months folder,
+# loads the newest EAGER_MONTHS at startup and older ones when asked for.
+STORAGE_MODE = os.environ.get("HOSTEL_STORAGE", "journal")
+COMPACT_EVERY = 500
+EAGER_MONTHS = 3
+MANIFEST_NAME = "manifest.json"
+CHANGES_DIR = "change_exports"  # default folder for incremental export batches
+
+# With a background writer, changes that arrive within SAVE_DELAY seconds of
+# the first unsaved one are written together, so nothing waits longer than that.
+SAVE_DELAY = 0.5
+
+# While it has nothing to write, the background writer takes in other
+# processes' saves every SYNC_EVERY seconds, so the caller never has to.
+SYNC_EVERY = 0.5
+
+# "memory" caches per-student monthly totals while the ledger is open;
+# "persist" also keeps them in <ledger>.summaries.json between runs.
+SUMMARY_CACHE = os.environ.get("HOSTEL_SUMMARY_CACHE", "memory")
+
+MAX_USUAL_MEALS = 10  # meal counts above this are asked about / reported
+PROGRESS_ROWS = 5000  # rows between progress(done, total) calls in exports and billing
+MAX_BAD_LINES = 10    # unreadable rows named when a load is refused
+SAVES_WIDTH = 20      # digits of the save count kept in the lock file
+
+DB_COLUMNS = "serial, roll, student, date, religion, prayer_done, meal_count, mess, hostel, electricity, inventory"
+DB_SCHEMA = """
+CREATE TABLE IF NOT EXISTS expenses (
+    id INTEGER PRIMARY KEY,
+    serial INTEGER, roll TEXT, student TEXT, date TEXT, religion TEXT, prayer_done TEXT,
+    meal_count INTEGER, mess REAL, hostel REAL, electricity REAL, inventory REAL
+);
+CREATE INDEX IF NOT EXISTS idx_expenses_serial ON expenses (serial);
+CREATE INDEX IF NOT EXISTS idx_expenses_roll ON expenses (roll);
+CREATE INDEX IF NOT EXISTS idx_expenses_date ON expenses (date);
+CREATE INDEX IF NOT EXISTS idx_expenses_roll_date ON expenses (roll, date);
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value INTEGER);
+"""
+INSERT_SQL = f"INSERT INTO expenses ({DB_COLUMNS}) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)"
+UPDATE_SQL = ("UPDATE expenses SET serial = ?, roll = ?, student = ?, date = ?, religion = ?, prayer_done = ?, "
+              "meal_count = ?, mess = ?, hostel = ?, electricity = ?, inventory = ? WHERE serial = ?")
+
+# ------------------- Records -------------------
+class Expense:
+    # One ledger row, parsed once at load time; the date is kept as an ordinal day
+    __slots__ = ("serial", "roll", "student", "day", "religion", "prayer_done",
+                 "meal_count", "mess", "hostel", "electricity", "inventory")
+
+    def __init__(self, serial, roll, student, day, religion, prayer_done,
+                 meal_count, mess, hostel, electricity, inventory):
+        self.serial = serial
+        self.roll = roll
+        self.student = student
+        self.day = day
+        self.religion = religion
+        self.prayer_done = prayer_done
+        self.meal_count = meal_count
+        self.mess = mess
+        self.hostel = hostel
+        self.electricity = electricity
+        self.inventory = inventory
+
+    @classmethod
+    def from_row(cls, row):
+        # Raises ValueError for rows that do not match the ledger schema
+        return cls(int(row[0]), sys.intern(str(row[1])), sys.intern(str(row[2])),
+                   date.fromisoformat(str(row[3])).toordinal(),
+                   sys.intern(str(row[4])), sys.intern(str(row[5])), int(row[6]),
+                   float(row[7] or 0), float(row[8] or 0), float(row[9] or 0), float(row[10] or 0))
+
+    @property
+    def date(self):
+        return date.fromordinal(self.day).isoformat()
+
+    @property
+    def total(self):
+        return self.mess + self.hostel + self.electricity + self.inventory
+
+    @property
+    def penalty(self):
+        # The extra meal charged when prayer was not done
+        if self.prayer_done == "No" and self.meal_count:
+            return self.mess / self.meal_count
+        return 0.0
+
+    def astuple(self):
+        # The raw fields in constructor order; far cheaper to pickle than the object
+        return (self.serial, self.roll, self.student, self.day, self.religion, self.prayer_done,
+                self.meal_count, self.mess, self.hostel, self.electricity, self.inventory)
+
+    def to_row(self):
+        return [self.serial, self.roll, self.student, self.date, self.religion, self.prayer_done,
+                self.meal_count, self.mess, self.hostel, self.electricity, self.inventory]
+
+def parse_rows(rows, source="ledger", first_line=2, unit="line"):
+    # Refuses the whole load when any row is malformed: a skipped row would be
+    # gone for good after the next save rewrites the file. Blank lines carry
+    # nothing and are dropped. Rows are counted from first_line (2 for a CSV
+    # after its header).
+    records, bad = [], []
+    for line_no, row in enumerate(rows, start=first_line):
+        if not row:
+            continue
+        try:
+            records.append(Expense.from_row(row))
+        except (ValueError, IndexError):
+            bad.append(line_no)
+    if bad:
+        shown = ", ".join(map(str, bad[:MAX_BAD_LINES])) + (", ..." if len(bad) > MAX_BAD_LINES else "")
+        raise ValueError(f"{source}: {len(bad)} unreadable rows ({unit} {shown}); "
+                         f"fix or remove them before loading")
+    return records
+
+def assign_serials(records):
+    # Key records by serial. Older ledgers reused serials after deletes, so
+    # any duplicate is renumbered past the highest serial in use.
+    top = max((rec.serial for rec in records), default=0)
+    by_serial = {}
+    renumbered = False
+    for rec in records:
+        if rec.serial <= 0 or rec.serial in by_serial:
+            top += 1
+            rec.serial = top
+            renumbered = True
+        by_serial[rec.serial] = rec
+    return by_serial, renumbered
+
+# ------------------- Expense Rules -------------------
+def parse_meal_count(meal_count):
+    # Blank means one meal. Raises ValueError.
+    try:
+        return int(str(meal_count or "").strip() or 1)
+    except ValueError:
+        raise ValueError("Enter a valid number for meal count!") from None
+
+def meal_count_warning(meal_count):
+    # What to ask before saving a meal count above MAX_USUAL_MEALS, or None;
+    # meal_count is as entered, before the prayer meal is added
+    meal_count = parse_meal_count(meal_count)
+    if meal_count > MAX_USUAL_MEALS:
+        return f"Meal count is {meal_count}, which is unusually high."
+    return None
+
+def build_expense(roll, student, religion, prayer_done, meal_count, meal_rate,
+                  hostel=0, electricity=0, inventory=0, day=None):
+    # The rules every entry point shares: required fields, a valid meal count,
+    # numeric costs, and one extra meal charged when prayer was not done.
+    # Raises ValueError. Ask about meal_count_warning() before saving.
+    roll = str(roll or "").strip()
+    student = str(student or "").strip()
+    if not roll or not student or not religion or not prayer_done:
+        raise ValueError("All required fields must be filled!")
+    meal_count = parse_meal_count(meal_count)
+    try:
+        meal_rate = float(meal_rate or 0)
+        hostel = float(hostel or 0)
+        electricity = float(electricity or 0)
+        inventory = float(inventory or 0)
+    except ValueError:
+        raise ValueError("Enter valid numeric values!") from None
+    if prayer_done == "No":
+        meal_count += 1
+    return Expense(None, roll, student, date.today().toordinal() if day is None else day,
+                   religion, prayer_done, meal_count, meal_rate * meal_count,
+                   hostel, electricity, inventory)
+
+def parse_day(text):
+    return datetime.strptime(text, "%Y-%m-%d").date().toordinal()
+
+def month_range(year, month):
+    # Raises ValueError for a month outside 1-12
+    return date(year, month, 1).toordinal(), date(year, month, monthrange(year, month)[1]).toordinal()
+
+def year_range(year):
+    return date(year, 1, 1).toordinal(), date(year, 12, 31).toordinal()
+
+def month_key(day):
+    # "YYYY-MM" of a date ordinal; keys sort the same way as the months
+    day = date.fromordinal(day)
+    return f"{day.year:04d}-{day.month:02d}"
+
+def filter_range(date_text="", month_text="", year_text="", from_text="", to_text=""):
+    # Turns the summary filters into (day_from, day_to, month). month is only
+    # set when it has no year, since it then matches that month in every year.
+    bounds = []
+    month_int = None
+    if date_text:
+        try:
+            day = parse_day(date_text)
+        except ValueError:
+            raise ValueError("Enter Date in YYYY-MM-DD format!") from None
+        bounds.append((day, day))
+
+    # Arbitrary From/To range, either end may be left open
+    try:
+        bounds.append((parse_day(from_text) if from_text else None,
+                       parse_day(to_text) if to_text else None))
+    except ValueError:
+        raise ValueError("Enter From/To dates in YYYY-MM-DD format!") from None
+
+    if month_text:
+        try:
+            month_int = int(month_text)
+        except ValueError:
+            raise ValueError("Enter a valid Month (1-12)!") from None
+    if year_text:
+        try:
+            year_int = int(year_text)
+            bounds.append(year_range(year_int))
+        except ValueError:
+            raise ValueError("Enter a valid Year (YYYY)!") from None
+        if month_int is not None:
+            try:
+                bounds.append(month_range(year_int, month_int))
+            except ValueError:
+                raise ValueError("Enter a valid Month (1-12)!") from None
+            month_int = None
+
+    day_from = max((b[0] for b in bounds if b[0] is not None), default=None)
+    day_to = min((b[1] for b in bounds if b[1] is not None), default=None)
+    return day_from, day_to, month_int
+
+def summarize(records):
+    summary = {"student": records[0].student if records else "", "records": len(records),
+               "mess": 0.0, "hostel": 0.0, "electricity": 0.0, "inventory": 0.0, "penalty": 0.0}
+    for rec in records:
+        summary["mess"] += rec.mess
+        summary["hostel"] += rec.hostel
+        summary["electricity"] += rec.electricity
+        summary["inventory"] += rec.inventory
+        summary["penalty"] += rec.penalty
+    # The penalty is already part of the meal cost
+    summary["total"] = summary["mess"] + summary["hostel"] + summary["electricity"] + summary["inventory"]
+    return summary
+
+# ------------------- Running Totals -------------------
+class ExpenseTotals:
+    # Per-category sums overall, per day (the header's "today") and per roll
+    # (the student count). Each bucket is [mess, hostel, electricity,
+    # inventory, row_count] and is updated in O(1) per change, so nothing
+    # ever rescans the ledger.
+    def __init__(self):
+        self.clear()
+
+    def clear(self):
+        self.overall = [0.0, 0.0, 0.0, 0.0, 0]
+        self.by_day = {}
+        self.by_student = {}
+
+    def rebuild(self, records):
+        self.clear()
+        for rec in records:
+            self.add(rec)
+
+    def add(self, rec):
+        self._apply(rec, 1)
+
+    def remove(self, rec):
+        self._apply(rec, -1)
+
+    def replace(self, old, new):
+        self._apply(old, -1)
+        self._apply(new, 1)
+
+    def _apply(self, rec, sign):
+        amounts = (rec.mess, rec.hostel, rec.electricity, rec.inventory)
+        self._bump(self.overall, amounts, sign)
+        for buckets, key in ((self.by_day, rec.day), (self.by_student, rec.roll)):
+            bucket = buckets.get(key)
+            if bucket is None:
+                bucket = buckets[key] = [0.0, 0.0, 0.0, 0.0, 0]
+            self._bump(bucket, amounts, sign)
+            if bucket[4] == 0:
+                del buckets[key]  # drop empty buckets so counts stay exact
+
+    @staticmethod
+    def _bump(bucket, amounts, sign):
+        for i, amount in enumerate(amounts):
+            bucket[i] += sign * amount
+        bucket[4] += sign
+        if bucket[4] == 0:
+            bucket[:4] = [0.0, 0.0, 0.0, 0.0]  # no float drift once a bucket empties
+
+    def category_totals(self):
+        return self.overall[:4]
+
+    def day_total(self, day):
+        return sum(self.by_day.get(day, (0.0, 0.0, 0.0, 0.0))[:4])
+
+    def student_count(self):
+        return len(self.by_student)
+
+# ------------------- Indexes -------------------
+class ExpenseIndex:
+    # roll -> sorted [(day, serial, record)] and every row as sorted
+    # [(day, serial, record)], so a student's rows in a date range are found
+    # with two bisects and nothing outside that range is touched. Serials are
+    # unique, so tuple comparison never reaches the record itself.
+    def __init__(self):
+        self.clear()
+
+    def clear(self):
+        self.by_roll = {}
+        self.by_day = []
+
+    def rebuild(self, records):
+        self.clear()
+        for rec in records:
+            key = (rec.day, rec.serial, rec)
+            self.by_roll.setdefault(rec.roll, []).append(key)
+            self.by_day.append(key)
+        for keys in self.by_roll.values():
+            keys.sort()
+        self.by_day.sort()
+
+    def add(self, rec):
+        key = (rec.day, rec.serial, rec)
+        insort(self.by_roll.setdefault(rec.roll, []), key)
+        insort(self.by_day, key)
+
+    def remove(self, rec):
+        key = (rec.day, rec.serial)
+        roll_keys = self.by_roll[rec.roll]
+        del roll_keys[bisect_left(roll_keys, key)]
+        if not roll_keys:
+            del self.by_roll[rec.roll]
+        del self.by_day[bisect_left(self.by_day, key)]
+
+    def replace(self, old, new):
+        self.remove(old)
+        self.add(new)
+
+    def query(self, roll=None, day_from=None, day_to=None):
+        keys = self.by_day if roll is None else self.by_roll.get(roll, [])
+        lo = 0 if day_from is None else bisect_left(keys, (day_from,))
+        hi = len(keys) if day_to is None else bisect_left(keys, (day_to + 1,))
+        return [key[2] for key in keys[lo:hi]]
+
+# ------------------- Student Registry -------------------
+def has_fixed_charge(rec):
+    return rec.hostel > 0 or rec.electricity > 0 or rec.inventory > 0
+
+class StudentRegistry:
+    # What is known about each roll, in O(1): the name and religion of the
+    # student's latest row (the last of the index's (day, serial) ordered
+    # rows for that roll) and how many rows carry a one-time charge.
+    def __init__(self, index):
+        self.index = index
+        self.clear()
+
+    def clear(self):
+        self.fixed = {}  # roll -> rows with a hostel, electricity or inventory charge
+
+    def rebuild(self, records):
+        self.clear()
+        for rec in records:
+            self.add(rec)
+
+    def add(self, rec):
+        if has_fixed_charge(rec):
+            self.fixed[rec.roll] = self.fixed.get(rec.roll, 0) + 1
+
+    def remove(self, rec):
+        if has_fixed_charge(rec):
+            left = self.fixed[rec.roll] - 1
+            if left:
+                self.fixed[rec.roll] = left
+            else:
+                del self.fixed[rec.roll]
+
+    def replace(self, old, new):
+        self.remove(old)
+        self.add(new)
+
+    def lookup(self, roll):
+        keys = self.index.by_roll.get(roll)
+        if not keys:
+            return None
+        latest = keys[-1][2]
+        return latest.student, latest.religion
+
+    def has_fixed_cost(self, roll):
+        return roll in self.fixed
+
+# ------------------- Summary Cache -------------------
+class SummaryCache:
+    # (roll, year, month) -> [mess, hostel, electricity, inventory, penalty,
+    # rows, student], filled on first use. A change drops exactly the
+    # entries of the rolls and months it touches.
+    def __init__(self):
+        self.entries = {}
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(rec):
+        day = date.fromordinal(rec.day)
+        return (rec.roll, day.year, day.month)
+
+    @staticmethod
+    def entry(records):
+        entry = [0.0, 0.0, 0.0, 0.0, 0.0, len(records), records[0].student if records else ""]
+        for rec in records:
+            entry[0] += rec.mess
+            entry[1] += rec.hostel
+            entry[2] += rec.electricity
+            entry[3] += rec.inventory
+            entry[4] += rec.penalty
+        return entry
+
+    def invalidate(self, rec):
+        self.entries.pop(self.key(rec), None)
+
+    def clear(self):
+        self.entries.clear()
+
+    def dump(self, stamp):
+        return {"stamp": stamp, "entries": [[*key, *entry] for key, entry in self.entries.items()]}
+
+    def restore(self, payload):
+        self.entries = {tuple(item[:3]): item[3:] for item in payload["entries"]}
+
+# ------------------- Data Handling -------------------
+def csv_payload(rows):
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    writer.writerow(HEADER)
+    writer.writerows(rec.to_row() for rec in rows)
+    return buf.getvalue().encode("utf-8")
+
+def segment_entry(records):
+    # What the manifest remembers about one month, so it can be counted,
+    # totalled and exported without being loaded
+    sums = [0.0, 0.0, 0.0, 0.0]
+    fixed_rolls = set()
+    latest = {}  # roll -> that month's latest row, for the student's name and religion
+    for rec in records:
+        sums[0] += rec.mess
+        sums[1] += rec.hostel
+        sums[2] += rec.electricity
+        sums[3] += rec.inventory
+        seen = latest.get(rec.roll)
+        if seen is None or (seen.day, seen.serial) < (rec.day, rec.serial):
+            latest[rec.roll] = rec
+        if has_fixed_charge(rec):
+            fixed_rolls.add(rec.roll)
+    return {"rows": len(records), "max_serial": max((rec.serial for rec in records), default=0),
+            "totals": sums, "rolls": sorted(latest), "fixed_rolls": sorted(fixed_rolls),
+            "students": {roll: [rec.student, rec.religion] for roll, rec in sorted(latest.items())}}
+
+def atomic_write(path, payload):
+    # Write to a temp file and swap it in, so a crash never leaves a half-written file
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(payload)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+def rebase_changes(changes, renumbered, dropped):
+    # Unsaved changes after a merge with another process's saves: new records
+    # whose serial was taken there move to their new serial, and edits and
+    # deletes that lost a conflict are dropped
+    kept = []
+    for op, serial, rec in changes:
+        if serial in dropped and op in ("edit", "delete"):
+            continue
+        if serial in renumbered:
+            serial = renumbered[serial]
+            if rec is not None:
+                rec.serial = serial
+        kept.append((op, serial, rec))
+    return kept
+
+# ------------------- File Locking -------------------
+class FileLock:
+    # Exclusive lock on a file next to the ledger, shared by every process
+    # using it. Held only while a process reads or writes the ledger files,
+    # never across a GUI interaction. Re-entrant within a process. The file
+    # also keeps a count of the saves made under it, see bump().
+    def __init__(self, path):
+        self.path = path
+        self.mutex = threading.RLock()
+        self.handle = None
+        self.depth = 0
+
+    def acquire(self):
+        self.mutex.acquire()
+        if self.depth == 0:
+            handle = os.fdopen(os.open(self.path, os.O_RDWR | os.O_CREAT | getattr(os, "O_BINARY", 0)), "r+b")
+            try:
+                if fcntl is not None:
+                    fcntl.flock(handle.fileno(), fcntl.LOCK_EX)
+                else:
+                    handle.seek(0)
+                    msvcrt.locking(handle.fileno(), msvcrt.LK_LOCK, 1)
+            except BaseException:
+                handle.close()
+                self.mutex.release()
+                raise
+            self.handle = handle
+        self.depth += 1
+
+    def release(self):
+        self.depth -= 1
+        if self.depth == 0:
+            handle, self.handle = self.handle, None
+            if fcntl is not None:
+                fcntl.flock(handle.fileno(), fcntl.LOCK_UN)
+            else:
+                handle.seek(0)
+                msvcrt.locking(handle.fileno(), msvcrt.LK_UNLCK, 1)
+            handle.close()
+        self.mutex.release()
+
+    def saves(self):
+        # The save count; read without the lock, so a count being written
+        # may read wrong, which only costs the reader a needless check
+        try:
+            with open(self.path, "rb") as f:
+                f.seek(1)  # byte 0 is the one locked on Windows
+                count = f.read(SAVES_WIDTH)
+        except FileNotFoundError:
+            return 0
+        return int(count) if count.isdigit() else 0
+
+    def bump(self):
+        # Called with the lock held after each save to the ledger files, so
+        # other processes see it even if the files kept their size and mtime
+        self.handle.seek(1)
+        count = self.handle.read(SAVES_WIDTH)
+        count = int(count) + 1 if count.isdigit() else 1
+        self.handle.seek(1)
+        self.handle.write(b"%0*d" % (SAVES_WIDTH, count))
+        self.handle.flush()
+        self.handle.seek(0)
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+
+class Ledger:
+    # The expense ledger: records keyed by serial (in ledger order) with their
+    # running totals and indexes, persisted through the chosen storage mode.
+    # Every change goes through insert/replace/remove/clear so the three stay
+    # in step; serials are record ids, so edits and deletes are O(1).
+    #
+    # Several processes may share the files. Each remembers the version (a
+    # save count kept in the lock file, and size and mtime of the files) it
+    # last read or wrote; before writing, under the file lock, it merges
+    # whatever others saved since then into its records. Edits to different
+    # records merge; when both sides changed the same record, the one saved
+    # first wins and the other side's change is dropped and reported through
+    # pop_conflicts(). Files are read and compared with only the file lock
+    # held; self.lock is taken just to apply the result, so a thread changing
+    # records never waits on a re-read.
+    def __init__(self, file_path=FILE_PATH, storage=None):
+        self.file_path = file_path
+        stem = os.path.splitext(file_path)[0]
+        self.journal_path = stem + ".journal"
+        self.db_path = stem + ".db"
+        self.segment_dir = stem + "_months"
+        self.summary_path = stem + ".summaries.json"
+        self.changes_path = stem + ".changes"  # saved changes not yet in every export, see export_changes
+        self.storage = storage or STORAGE_MODE
+        self.records = {}
+        self.totals = ExpenseTotals()
+        self.index = ExpenseIndex()
+        self.students = StudentRegistry(self.index)
+        self.summaries = SummaryCache()
+        self.next_serial = 1      # serial handed to the next new record, saved so a deleted one is never reused
+        self.serial_mark = 1      # the highest next_serial seen on disk, see _high_serial
+        self.journal_base = None  # sha1 of the snapshot the current journal applies to
+        self.journal_count = 0    # changes appended since the last compaction
+        self.db_conn = None
+        self.segments = {}        # "YYYY-MM" -> manifest entry, for partitioned storage
+        self.loaded_months = set()
+        self.dirty_months = set() # months whose segment must be rewritten
+        self.lock = threading.Lock()  # held while records change or are copied, never while files are read
+        self.writer = None        # LedgerWriter once start_writer() is called
+        self.file_lock = FileLock(stem + ".lock")  # taken before self.lock, never after
+        self.version = None       # _storage_stamp() as last read or written by this process
+        self.journal_offset = 0   # bytes of the journal already applied
+        self.base = {}            # serial -> record as last saved (None if new), for unsaved changes
+        self.base_cleared = False # a Clear All Data is not saved yet
+        self.conflicts = []       # serials whose change here lost to another process's
+        self.merges = 0           # times changes saved by another process were merged in
+        self.queued = []          # changes waiting for _save_queued() when there is no writer
+        self.revision = 0         # bumped whenever the records in memory change
+
+    @timed("load_data")
+    def load(self, progress=None):
+        # progress(fraction, label) is called as each loading phase starts
+        report = progress or (lambda fraction, label: None)
+        report(0.0, "Reading ledger...")
+        with self.file_lock:
+            self._load_summaries()  # before loading, which may touch the files the cache was stamped with
+            if self.storage == "sqlite":
+                self.records = self._load_db()
+            elif self.storage == "partitioned":
+                self.records = self._load_partitions(report)
+            else:
+                self.records = self._load_csv(report)
+            self.version = self._storage_stamp()
+        self.next_serial = max(self._high_serial(), max(self.records, default=0) + 1,
+                               max((entry["max_serial"] for entry in self.segments.values()), default=0) + 1)
+        report(0.7, "Building totals...")
+        self.totals.rebuild(self.records.values())
+        report(0.85, "Building indexes...")
+        self.index.rebuild(self.records.values())
+        self.students.rebuild(self.records.values())
+        self.revision += 1
+        report(1.0, f"Loaded {len(self.records)} records")
+        return self
+
+    @timed("save_data")
+    def save(self):
+        # Rewrites the whole ledger, after taking in what other processes saved
+        with self.file_lock:
+            self._sync_locked()
+            with self.lock:
+                self.base, self.base_cleared = {}, False
+                if self.storage == "partitioned":
+                    self.dirty_months |= self.loaded_months
+                    rows = self._snapshot(0)
+                else:
+                    rows = list(self.records.values())
+            if self.storage == "sqlite":
+                self._write_db(rows)
+            elif self.storage == "partitioned":
+                self._write_segments(rows)
+            else:
+                self._write_csv(rows)
+            self.version = self._storage_stamp()
+
+    def compact(self):
+        # Fold pending journal entries back into the CSV
+        self.flush()
+        if self.journal_count:
+            self.save()
+
+    def start_writer(self, delay=SAVE_DELAY, sync_every=SYNC_EVERY):
+        # From now on changes are saved, and other processes' saves taken in,
+        # on a worker thread instead of by the caller
+        self.writer = LedgerWriter(self, delay, sync_every)
+        return self.writer
+
+    def flush(self):
+        # Wait until every change so far is on disk; raises the error if saving fails
+        if self.writer is not None:
+            self.writer.flush()
+
+    def sync(self):
+        # Take in what other processes saved since this one last read or
+        # wrote; True if the records changed. Cheap when nothing was saved.
+        if self.version == self._storage_stamp():
+            return False
+        merges = self.merges
+        with self.file_lock:
+            self._sync_locked()
+        return self.merges != merges
+
+    def pop_conflicts(self):
+        if not self.conflicts:
+            return []  # the usual case, without waiting on a merge in progress
+        with self.lock:
+            conflicts, self.conflicts = self.conflicts, []
+        return conflicts
+
+    def close(self):
+        saved = True
+        if self.writer is not None:
+            self.writer.close()
+            saved = self.writer.failed is None
+            self.writer = None
+        if self.db_conn is not None:
+            self.db_conn.close()
+            self.db_conn = None
+        if SUMMARY_CACHE == "persist" and saved:
+            # Stamped with the files as left now, so a cache that outlived them is ignored
+            payload = json.dumps(self.summaries.dump(self._storage_stamp()))
+            atomic_write(self.summary_path, payload.encode("utf-8"))
+
+    # ---------- Changes ----------
+    def insert(self, rec):
+        self.insert_many([rec])
+        return rec
+
+    def insert_many(self, recs):
+        # A whole batch is persisted with a single write
+        changes = []
+        for day in {rec.day for rec in recs}:
+            self.load_months(day, day)  # a month's segment is rewritten whole, so it must be loaded
+        with self.lock:
+            for rec in recs:
+                rec.serial = self._new_serial()
+                self.base[rec.serial] = None
+                self.records[rec.serial] = rec
+                self.totals.add(rec)
+                self.index.add(rec)
+                self.students.add(rec)
+                self.summaries.invalidate(rec)
+                self._touch(rec.day)
+                changes.append(("add", rec.serial, rec))
+            self._persist(changes)
+        self._save_queued()
+
+    def replace(self, serial, rec):
+        rec.serial = serial
+        self.load_months(rec.day, rec.day)
+        with self.lock:
+            old = self.records[serial]
+            self.base.setdefault(serial, old)
+            self.totals.replace(old, rec)
+            self.index.replace(old, rec)
+            self.students.replace(old, rec)
+            self.records[serial] = rec
+            self.summaries.invalidate(old)
+            self.summaries.invalidate(rec)
+            self._touch(old.day)
+            self._touch(rec.day)
+            self._persist([("edit", serial, rec)])
+        self._save_queued()
+
+    def remove(self, serial):
+        with self.lock:
+            rec = self.records.pop(serial)
+            self.base.setdefault(serial, rec)
+            self.totals.remove(rec)
+            self.index.remove(rec)
+            self.students.remove(rec)
+            self.summaries.invalidate(rec)
+            self._touch(rec.day)
+            self._persist([("delete", serial, None)])
+        self._save_queued()
+        return rec
+
+    def clear(self):
+        with self.lock:
+            for serial, rec in self.records.items():
+                self.base.setdefault(serial, rec)
+            self.base_cleared = True
+            self.records.clear()
+            self.totals.clear()
+            self.index.clear()
+            self.students.clear()
+            self.summaries.clear()
+            if self.storage == "partitioned":
+                # every segment goes, loaded or not
+                self.loaded_months |= set(self.segments)
+                self.dirty_months |= self.loaded_months
+            self._persist([("clear", None, None)])
+        self._save_queued()
+
+    def _touch(self, day):
+        if self.storage == "partitioned":
+            key = month_key(day)
+            self.dirty_months.add(key)
+            self.loaded_months.add(key)  # a month with no segment yet counts as loaded
+
+    def _persist(self, changes):
+        # Called with the lock held, right after the in-memory change. The
+        # writer saves the changes; without one, the caller saves them with
+        # _save_queued() once the lock is released.
+        if not changes:
+            return
+        self.revision += 1
+        if self.writer is not None:
+            self.writer.submit(changes)
+        else:
+            self.queued.extend(changes)
+
+    def _save_queued(self):
+        # Saves the queued changes on this thread, when there is no writer
+        if self.writer is not None or not self.queued:
+            return
+        with self.file_lock:
+            self._sync_locked()  # may rebase self.queued
+            with self.lock:
+                changes, self.queued = self.queued, []
+                base = self._take_base()
+                rows = self._snapshot(len(changes))
+            if not changes:
+                return  # another thread saved them
+            try:
+                self._write_changes(changes, rows)
+            except Exception:
+                with self.lock:
+                    self._requeue(base, rows)
+                raise
+            self.version = self._storage_stamp()
+
+    def _new_serial(self):
+        # Called with the lock held
+        serial = self._high_serial()
+        self.next_serial = serial + 1
+        return serial
+
+    def _high_serial(self):
+        # next_serial, or the high-water mark last read from the files if that
+        # is higher. Readers raise serial_mark instead of next_serial because
+        # they run without the lock.
+        return max(self.next_serial, self.serial_mark)
+
+    def _take_base(self):
+        # Called with the lock held as a batch is taken for writing
+        base = (self.base, self.base_cleared)
+        self.base, self.base_cleared = {}, False
+        return base
+
+    def _requeue(self, base, rows):
+        # The batch was not written, so its changes are unsaved again: the
+        # older base value of a record wins and its months are still dirty
+        older, cleared = base
+        self.base.update(older)
+        self.base_cleared = self.base_cleared or cleared
+        if self.storage == "partitioned" and rows:
+            self.dirty_months |= set(rows)
+
+    def _snapshot(self, count):
+        # Called with the lock held: what writing count more changes needs
+        # besides the changes themselves. That is the whole ledger when the CSV
+        # is rewritten, the records of every touched month for segments, and
+        # None when the changes are enough.
+        if self.storage == "partitioned":
+            months, self.dirty_months = self.dirty_months, set()
+            return {key: self._month_records(key) for key in months}
+        if self.storage == "csv" or (self.storage == "journal" and self.journal_count + count >= COMPACT_EVERY):
+            return list(self.records.values())
+        return None
+
+    @timed("save_data")
+    def _write_changes(self, changes, rows):
+        # rows comes from _snapshot, taken together with the changes
+        self._log_changes(changes)
+        if self.storage == "sqlite":
+            self._record_db_changes(changes)
+            return
+        if self.storage == "partitioned":
+            self._write_segments(rows)
+            return
+        if self.storage != "journal":
+            self._write_csv(rows)
+            return
+        lines = []
+        for op, serial, rec in changes:
+            entry = {"op": op}
+            if op == "delete":
+                entry["serial"] = serial
+            if rec is not None:
+                entry["row"] = [str(value) for value in rec.to_row()]
+            lines.append(json.dumps(entry) + "\n")
+        with open(self.journal_path, "a", encoding="utf-8", newline="") as f:
+            f.write("".join(lines))
+            f.flush()
+            os.fsync(f.fileno())
+            self.journal_offset = os.fstat(f.fileno()).st_size
+        self.file_lock.bump()
+        self.journal_count += len(changes)
+        if self.journal_count >= COMPACT_EVERY:
+            self._write_csv(rows)
+
+    def _log_changes(self, changes):
+        # One "op,serial,date" line per change, once export_changes() has
+        # started the log. Synced to disk ahead of the change itself, so
+        # every saved change is logged; a write that fails is at worst
+        # exported once more.
+        lines = [f"{op},{'' if serial is None else serial},{'' if rec is None else rec.date}\n"
+                 for op, serial, rec in changes]
+        try:
+            fd = os.open(self.changes_path, os.O_WRONLY | os.O_APPEND | getattr(os, "O_BINARY", 0))
+        except FileNotFoundError:
+            return  # nothing has been exported, so nothing needs to be logged
+        with os.fdopen(fd, "ab") as f:
+            f.write("".join(lines).encode("utf-8"))
+            f.flush()
+            os.fsync(f.fileno())
+
+    def _read_changes_header(self, f):
+        # (base, exports, header size) of the open change log. Offsets count
+        # from the start of the whole log, and base is the offset of the
+        # first line still kept, so they stay valid when the log is trimmed.
+        first = f.readline()
+        if not first.startswith(b"{") or not first.endswith(b"\n"):
+            f.seek(0)  # a log from before trimming
+            return 0, {}, 0
+        header = json.loads(first)
+        return header["base"], header.get("exports", {}), len(first)
+
+    def _write_changes_log(self, base, exports, kept=b""):
+        header = json.dumps({"base": base, "exports": exports}) + "\n"
+        atomic_write(self.changes_path, header.encode("utf-8") + kept)
+
+    def start_changes_log(self):
+        # Called under the file lock by the first export: every change saved
+        # from here on is logged
+        if not os.path.exists(self.changes_path):
+            self._write_changes_log(0, {})
+
+    def trim_changes_log(self, out_dir, offset):
+        # out_dir has exported everything before offset. Lines every export
+        # folder has are dropped; a folder whose manifest is gone no longer
+        # holds the log back.
+        with self.file_lock:
+            if not os.path.exists(self.changes_path):
+                return
+            with open(self.changes_path, "rb") as f:
+                base, exports, _ = self._read_changes_header(f)
+                rest = f.read()
+            exports[os.path.abspath(out_dir)] = offset
+            exports = {folder: kept for folder, kept in exports.items()
+                       if os.path.exists(os.path.join(folder, MANIFEST_NAME))}
+            low = max(min(exports.values(), default=offset), base)
+            self._write_changes_log(low, exports, rest[low - base:])
+
+    # ---------- Queries ----------
+    def changes_since(self, offset=0):
+        # Logged changes from byte offset on as (op, serial, day) and the
+        # offset after them; None when the log no longer reaches offset
+        entries = []
+        with self.file_lock:
+            if not os.path.exists(self.changes_path):
+                return (None, 0) if offset else ([], 0)
+            with open(self.changes_path, "rb") as f:
+                base, _, start = self._read_changes_header(f)
+                if offset < base or f.seek(0, os.SEEK_END) - start < offset - base:
+                    return None, 0
+                f.seek(start + offset - base)
+                for line in f:
+                    if not line.endswith(b"\n"):
+                        break  # torn write at the tail, the change never completed
+                    op, serial, day = line.decode("utf-8").rstrip("\n").split(",")
+                    entries.append((op, int(serial) if serial else None,
+                                    date.fromisoformat(day).toordinal() if day else None))
+                    offset += len(line)
+        return entries, offset
+
+    def changes_end(self):
+        # changes_since()'s end offset without reading the log
+        with self.file_lock:
+            if not os.path.exists(self.changes_path):
+                return 0
+            with open(self.changes_path, "rb") as f:
+                base, _, start = self._read_changes_header(f)
+                size = f.seek(0, os.SEEK_END)
+                f.seek(max(size - 4096, start))
+                tail = f.read()
+        return base + size - len(tail) + tail.rfind(b"\n") + 1 - start
+
+    def query(self, roll=None, day_from=None, day_to=None):
+        # day_from/day_to are inclusive date ordinals
+        if self.storage == "sqlite":
+            self.flush()  # the database must hold every change before it is asked
+            clauses, params = [], []
+            if roll is not None:
+                clauses.append("roll = ?")
+                params.append(roll)
+            # ISO date strings sort the same way as the days they name
+            if day_from is not None:
+                clauses.append("date >= ?")
+                params.append(date.fromordinal(day_from).isoformat())
+            if day_to is not None:
+                clauses.append("date <= ?")
+                params.append(date.fromordinal(day_to).isoformat())
+            where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+            rows = self._open_db().execute(f"SELECT {DB_COLUMNS} FROM expenses {where} ORDER BY id", params)
+            return parse_rows(rows)
+        self.load_months(day_from, day_to)
+        return self.index.query(roll, day_from, day_to)
+
+    def student_rows(self, roll, day_from=None, day_to=None, month=None):
+        rows = self.query(roll, day_from, day_to)
+        if month is not None:
+            rows = [rec for rec in rows if date.fromordinal(rec.day).month == month]
+        return rows
+
+    def month_summary(self, roll, year, month):
+        # One cached entry (see SummaryCache), computed from the rows on a miss
+        key = (roll, year, month)
+        entry = self.summaries.entries.get(key)
+        if entry is not None:
+            self.summaries.hits += 1
+            return entry
+        self.summaries.misses += 1
+        # Read without the lock, which query() may need to flush the writer. A
+        # change landing meanwhile may have been missed, so only a read that
+        # no change overlapped is cached.
+        revision = self.revision
+        entry = SummaryCache.entry(self.query(roll, *month_range(year, month)))
+        with self.lock:
+            if self.revision == revision:
+                self.summaries.entries[key] = entry
+        return entry
+
+    def student_summary(self, roll, day_from=None, day_to=None, month=None):
+        # summarize() of student_rows(); a range of whole months adds up cached
+        # month entries instead of touching rows. None when nothing matches.
+        months = []
+        if month is None and day_from is not None and day_to is not None:
+            first, last = date.fromordinal(day_from), date.fromordinal(day_to)
+            if first.day == 1 and day_to == month_range(last.year, last.month)[1]:
+                months = [(year, m) for year in range(first.year, last.year + 1) for m in range(1, 13)
+                          if (first.year, first.month) <= (year, m) <= (last.year, last.month)]
+        if not months:
+            summary = summarize(self.student_rows(roll, day_from, day_to, month))
+            return summary if summary["records"] else None
+        summary = {"student": "", "records": 0, "mess": 0.0, "hostel": 0.0, "electricity": 0.0,
+                   "inventory": 0.0, "penalty": 0.0}
+        for year, m in months:
+            entry = self.month_summary(roll, year, m)
+            if not entry[5]:
+                continue
+            summary["student"] = summary["student"] or entry[6]
+            summary["records"] += entry[5]
+            for i, name in enumerate(("mess", "hostel", "electricity", "inventory", "penalty")):
+                summary[name] += entry[i]
+        summary["total"] = summary["mess"] + summary["hostel"] + summary["electricity"] + summary["inventory"]
+        return summary if summary["records"] else None
+
+    def has_fixed_cost(self, roll):
+        # Whether the student was ever charged the one-time costs
+        if self.students.has_fixed_cost(roll):
+            return True
+        return any(roll in entry["fixed_rolls"] for entry in self._unloaded_segments())
+
+    def known_rolls(self):
+        # Every roll in the ledger, numeric rolls in number order
+        rolls = set(self.index.by_roll)
+        for entry in self._unloaded_segments():
+            rolls.update(entry["rolls"])
+        return sorted(rolls, key=lambda roll: (not roll.isdigit(), int(roll) if roll.isdigit() else 0, roll))
+
+    def student_info(self, roll):
+        # (name, religion) from the student's latest row, None for an unknown roll
+        found = self.students.lookup(roll)
+        if found is not None:
+            return found
+        for key, entry in sorted(self.segments.items(), reverse=True):
+            if key not in self.loaded_months and roll in entry["students"]:
+                return tuple(entry["students"][roll])
+        return None
+
+    def category_totals(self):
+        # Loaded records plus the stored sums of months that are not loaded yet
+        totals = self.totals.category_totals()
+        for entry in self._unloaded_segments():
+            totals = [total + amount for total, amount in zip(totals, entry["totals"])]
+        return totals
+
+    def student_count(self):
+        rolls = set(self.totals.by_student)
+        for entry in self._unloaded_segments():
+            rolls.update(entry["rolls"])
+        return len(rolls)
+
+    # ---------- Summary Cache File ----------
+    def _storage_stamp(self):
+        # The save count, and size and mtime of the files that hold the ledger
+        # in this storage mode for saves made by hand or by older versions
+        if self.storage == "sqlite":
+            paths = [self.db_path, self.db_path + "-wal"]  # commits land in the WAL first
+        elif self.storage == "partitioned":
+            paths = [os.path.join(self.segment_dir, MANIFEST_NAME)]
+        else:
+            paths = [self.file_path, self.journal_path]
+        stamp = {"saves": self.file_lock.saves()}
+        for path in paths:
+            if os.path.exists(path):
+                stat = os.stat(path)
+                stamp[path] = [stat.st_size, stat.st_mtime_ns]
+        return stamp
+
+    def _load_summaries(self):
+        self.summaries.clear()
+        if SUMMARY_CACHE != "persist" or not os.path.exists(self.summary_path):
+            return
+        try:
+            with open(self.summary_path, "r", encoding="utf-8") as f:
+                payload = json.load(f)
+        except ValueError:
+            return
+        if payload.get("stamp") == self._storage_stamp():
+            self.summaries.restore(payload)
+
+    # ---------- Other Processes ----------
+    def _sync_locked(self):
+        # Called with the file lock held and the lock not held. Merges what
+        # other processes saved since self.version and rebases the unsaved
+        # changes to match (see rebase_changes). Holding the file lock keeps
+        # this process from saving, so what it last saved (_synced_view) stays
+        # put while the files are read and compared without the lock.
+        foreign = self._foreign_changes()
+        if not foreign:
+            return
+        with self.lock:
+            self.merges += 1
+            self.revision += 1
+            renumbered, dropped = self._merge(foreign)
+            if renumbered or dropped:
+                self.queued = rebase_changes(self.queued, renumbered, dropped)
+                if self.writer is not None:
+                    with self.writer.cond:
+                        self.writer.pending = rebase_changes(self.writer.pending, renumbered, dropped)
+
+    def _foreign_changes(self):
+        # {serial: record, or None if deleted} saved by other processes since
+        # self.version. A journal that only grew is read from where this
+        # process left it; anything else is reloaded and compared.
+        stamp = self._storage_stamp()
+        if stamp == self.version:
+            return {}
+        if self.storage == "partitioned":
+            foreign = self._foreign_segment_changes()
+        elif (self.storage == "journal" and self.journal_offset
+              and stamp.get(self.file_path) == self.version.get(self.file_path)
+              and stamp.get(self.journal_path, [0])[0] >= self.journal_offset):
+            foreign = self._foreign_journal_changes()
+        else:
+            if self.storage == "sqlite":
+                disk, _ = assign_serials(parse_rows(self._open_db().execute(
+                    f"SELECT {DB_COLUMNS} FROM expenses ORDER BY id")))
+                self.serial_mark = max(self.serial_mark, self._read_db_serial())
+            else:
+                disk, _, applied = self._read_csv()
+                self.journal_count = applied
+                if self.storage == "journal" and not self.journal_offset:
+                    self._start_journal()  # the CSV was rewritten without one
+            foreign = self._diff(disk, self._synced_copy())
+        self.version = self._storage_stamp()
+        return foreign
+
+    def _foreign_journal_changes(self):
+        entries, end = self._read_journal(self.journal_offset)
+        if os.path.getsize(self.journal_path) > end:
+            # Torn tail of a process that died mid-write; appending after it would hide every later entry
+            with open(self.journal_path, "r+b") as f:
+                f.truncate(end)
+        foreign = {}
+        for entry in entries:
+            op = entry.get("op")
+            if op in ("add", "edit"):
+                rec = Expense.from_row(entry["row"])
+                foreign[rec.serial] = rec
+                self.serial_mark = max(self.serial_mark, rec.serial + 1)  # even if deleted again
+            elif op == "delete":
+                foreign[entry["serial"]] = None
+            elif op == "clear":
+                foreign = dict.fromkeys(set(self._synced_copy()) | set(foreign))
+        self.journal_offset = end
+        self.journal_count += len(entries)
+        return foreign
+
+    def _foreign_segment_changes(self):
+        # Only loaded months matter: the others are read fresh when needed
+        fresh = self._read_manifest() if os.path.isdir(self.segment_dir) else {}
+        changed = {key for key in set(fresh) | set(self.segments)
+                   if (fresh.get(key) or {}).get("mtime_ns") != (self.segments.get(key) or {}).get("mtime_ns")
+                   or (fresh.get(key) or {}).get("size") != (self.segments.get(key) or {}).get("size")}
+        with self.lock:
+            months = changed & self.loaded_months
+            view = self._synced_view() if months else {}
+        disk = {rec.serial: rec for key in sorted(months) if key in fresh for rec in self._read_segment(key)}
+        view = {serial: rec for serial, rec in view.items() if month_key(rec.day) in months}
+        self.segments = fresh
+        self.serial_mark = max([self.serial_mark] + [entry["max_serial"] + 1 for entry in fresh.values()])
+        return self._diff(disk, view)
+
+    def _synced_copy(self):
+        # _synced_view() for a caller without the lock; a dict copy, so the
+        # lock is held for milliseconds
+        with self.lock:
+            return self._synced_view()
+
+    def _synced_view(self):
+        # Called with the lock held: the records as this process last saved
+        # them, without its unsaved changes
+        view = dict(self.records)
+        for serial, rec in self.base.items():
+            if rec is None:
+                view.pop(serial, None)
+            else:
+                view[serial] = rec
+        return view
+
+    @staticmethod
+    def _diff(disk, view):
+        foreign = {serial: rec for serial, rec in disk.items()
+                   if serial not in view or view[serial].astuple() != rec.astuple()}
+        foreign.update((serial, None) for serial in view if serial not in disk)
+        return foreign
+
+    def _merge(self, foreign):
+        # Apply other processes' changes to the records, keeping this one's
+        # unsaved changes unless both sides changed the same record
+        renumbered, dropped = {}, set()
+        self.next_serial = max(self.next_serial, max((serial for serial, rec in foreign.items()
+                                                      if rec is not None), default=0) + 1)
+        if self.base_cleared:
+            # The Clear All Data waiting to be saved removes these as well
+            self.conflicts.extend(sorted(foreign))
+            if self.storage == "partitioned":
+                self.loaded_months |= set(self.segments)
+                self.dirty_months |= self.loaded_months
+            return renumbered, dropped
+        for serial, theirs in foreign.items():
+            if serial in self.base:
+                mine = self.records.get(serial)
+                if self.base[serial] is None:
+                    if theirs is None:
+                        continue
+                    # Both added a record under this serial: theirs keeps it, ours moves on
+                    new = self._new_serial()
+                    del self.base[serial]
+                    self.base[new] = None
+                    renumbered[serial] = new
+                    if mine is not None:
+                        self._put(serial, None)
+                        mine.serial = new
+                        self._put(new, mine)
+                elif (mine is None and theirs is None) or (
+                        mine is not None and theirs is not None and mine.astuple() == theirs.astuple()):
+                    del self.base[serial]  # both made the same change
+                    continue
+                else:
+                    del self.base[serial]
+                    dropped.add(serial)
+                    self.conflicts.append(serial)
+            self._put(serial, theirs)
+        return renumbered, dropped
+
+    def _put(self, serial, rec):
+        # Set one record without recording it as a change of this process
+        old = self.records.get(serial)
+        if old is not None:
+            self.totals.remove(old)
+            self.index.remove(old)
+            self.students.remove(old)
+            self.summaries.invalidate(old)
+        if rec is None:
+            self.records.pop(serial, None)
+            return
+        self.records[serial] = rec  # an edit keeps the record's place
+        self.totals.add(rec)
+        self.index.add(rec)
+        self.students.add(rec)
+        self.summaries.invalidate(rec)
+
+    # ---------- CSV + Journal ----------
+    def _read_journal(self, offset=0):
+        # Complete entries from byte offset on, and the offset after the last
+        # of them; the entry at offset 0 is the header
+        entries = []
+        with open(self.journal_path, "rb") as f:
+            f.seek(offset)
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break  # torn write at the tail, the change never completed
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    break
+                entries.append(entry)
+                offset += len(line)
+        return entries, offset
+
+    def _replay_journal(self, records, base):
+        self.journal_offset = 0
+        if not os.path.exists(self.journal_path):
+            return 0
+        entries, end = self._read_journal()
+        if entries:
+            self.serial_mark = max(self.serial_mark, entries[0].get("next_serial", 1))
+        # A journal of an older snapshot, which already contains its changes, is ignored
+        if not entries or entries[0].get("base") != base:
+            return 0
+        for entry in entries[1:]:
+            op = entry.get("op")
+            if op in ("add", "edit"):
+                rec = Expense.from_row(entry["row"])
+                records[rec.serial] = rec  # an edit keeps the record's place
+                self.serial_mark = max(self.serial_mark, rec.serial + 1)
+            elif op == "delete":
+                records.pop(entry["serial"], None)
+            elif op == "clear":
+                records.clear()
+        self.journal_offset = end
+        return len(entries) - 1
+
+    def _read_csv(self, report=None):
+        # The records as the CSV and its journal hold them, whether any serial
+        # had to be renumbered, and how many journal entries were applied
+        report = report or (lambda fraction, label: None)
+        rows = []
+        payload = b""
+        if os.path.exists(self.file_path):
+            with open(self.file_path, "rb") as f:
+                payload = f.read()
+            reader = csv.reader(io.StringIO(payload.decode("utf-8"), newline=""))
+            next(reader, None)
+            rows = list(reader)
+        self.journal_base = hashlib.sha1(payload).hexdigest()
+        report(0.2, f"Parsing {len(rows)} rows...")
+        records, renumbered = assign_serials(parse_rows(rows, self.file_path))
+        self.serial_mark = max(self.serial_mark, max(records, default=0) + 1)
+        report(0.5, "Replaying journal...")
+        return records, renumbered, self._replay_journal(records, self.journal_base)
+
+    def _load_csv(self, report=None):
+        records, renumbered, applied = self._read_csv(report)
+        self.journal_count = 0
+        if renumbered:
+            self._log_changes([("renumber", None, None)])  # serials moved, so the next export is a full one
+        if applied or renumbered:
+            self._write_csv(records.values())
+        elif self.storage == "journal":
+            self._start_journal()
+        return records
+
+    def _write_csv(self, rows):
+        payload = csv_payload(rows)
+        atomic_write(self.file_path, payload)
+        self.file_lock.bump()
+        self.journal_base = hashlib.sha1(payload).hexdigest()
+        self.journal_count = 0
+        if self.storage in ("journal", "csv"):
+            self._start_journal()  # in csv mode just the header, for the serial high-water mark
+        elif os.path.exists(self.journal_path):
+            os.remove(self.journal_path)
+            self.journal_offset = 0
+
+    def _start_journal(self):
+        header = (json.dumps({"base": self.journal_base, "next_serial": self._high_serial()}) + "\n").encode("utf-8")
+        atomic_write(self.journal_path, header)
+        self.journal_offset = len(header)
+
+    # ---------- Month Segments ----------
+    def _segment_path(self, key):
+        return os.path.join(self.segment_dir, key + ".csv")
+
+    def _unloaded_segments(self):
+        segments = self.segments  # replaced whole by the writer, never changed in place
+        return [entry for key, entry in segments.items() if key not in self.loaded_months]
+
+    def _month_records(self, key):
+        first, last = month_range(int(key[:4]), int(key[5:]))
+        return sorted(self.index.query(None, first, last), key=lambda rec: rec.serial)
+
+    def _read_segment(self, key):
+        with open(self._segment_path(key), "r", encoding="utf-8", newline="") as f:
+            reader = csv.reader(f)
+            next(reader, None)
+            return parse_rows(reader, self._segment_path(key))
+
+    def _read_manifest(self):
+        # Entries whose file changed behind our back (or is new) are rebuilt
+        # from the file; size and mtime are enough to notice that.
+        manifest = {}
+        path = os.path.join(self.segment_dir, MANIFEST_NAME)
+        if os.path.exists(path):
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    manifest = json.load(f)
+            except ValueError:
+                manifest = {}
+        self.serial_mark = max(self.serial_mark, manifest.pop("next_serial", 1))
+        segments, rebuilt = {}, False
+        for name in sorted(os.listdir(self.segment_dir)):
+            key, ext = os.path.splitext(name)
+            if ext != ".csv" or len(key) != 7:
+                continue
+            stat = os.stat(self._segment_path(key))
+            entry = manifest.get(key)
+            if (entry is None or entry.get("size") != stat.st_size or entry.get("mtime_ns") != stat.st_mtime_ns
+                    or "students" not in entry):  # manifests from before names were kept
+                entry = segment_entry(self._read_segment(key))
+                entry.update(size=stat.st_size, mtime_ns=stat.st_mtime_ns)
+                rebuilt = True
+            segments[key] = entry
+        if rebuilt or len(segments) != len(manifest):
+            self._write_manifest(segments)
+        return segments
+
+    def _write_manifest(self, segments):
+        # Beside the "YYYY-MM" entries, the serial high-water mark
+        payload = json.dumps(dict(segments, next_serial=self._high_serial()), sort_keys=True).encode("utf-8")
+        atomic_write(os.path.join(self.segment_dir, MANIFEST_NAME), payload)
+
+    def _load_partitions(self, report):
+        if not os.path.isdir(self.segment_dir) and os.path.exists(self.file_path):
+            self.migrate_csv_to_segments()
+        self.segments = self._read_manifest() if os.path.isdir(self.segment_dir) else {}
+        # The newest months, plus this month if it has a segment
+        eager = set(sorted(self.segments)[-EAGER_MONTHS:])
+        current = month_key(date.today().toordinal())
+        if current in self.segments:
+            eager.add(current)
+        report(0.2, f"Reading {len(eager)} of {len(self.segments)} months...")
+        records, renumbered = assign_serials([rec for key in sorted(eager) for rec in self._read_segment(key)])
+        self.loaded_months = eager
+        self.dirty_months = set()
+        if renumbered:
+            self._log_changes([("renumber", None, None)])
+            months = {key: [] for key in eager}
+            for rec in records.values():
+                months[month_key(rec.day)].append(rec)
+            self._write_segments(months)
+        return records
+
+    def load_months(self, day_from=None, day_to=None):
+        # Pull in the not yet loaded months overlapping [day_from, day_to]
+        if self.storage != "partitioned":
+            return 0
+        first = None if day_from is None else month_key(day_from)
+        last = None if day_to is None else month_key(day_to)
+
+        def wanted_months():
+            return sorted(key for key in self.segments if key not in self.loaded_months
+                          and (first is None or key >= first) and (last is None or key <= last))
+
+        if not wanted_months():
+            return 0
+        with self.file_lock:
+            # Current with other processes first, so no record is read in two versions
+            self._sync_locked()
+            with self.lock:
+                wanted = wanted_months()
+            loaded = [rec for key in wanted for rec in self._read_segment(key)]
+            with self.lock:
+                # A Clear All Data meanwhile counts every month as loaded
+                wanted = [key for key in wanted if key not in self.loaded_months]
+                loaded = [rec for rec in loaded if month_key(rec.day) in wanted]
+                for rec in loaded:
+                    if rec.serial <= 0 or rec.serial in self.records:
+                        rec.serial = self._new_serial()  # clash with a loaded month, give it a fresh id
+                        self.dirty_months.add(month_key(rec.day))
+                    self.records[rec.serial] = rec
+                    self.totals.add(rec)
+                    self.index.add(rec)
+                    self.students.add(rec)
+                self.loaded_months.update(wanted)
+                self.revision += 1
+                # Keep the ledger in month order, as a full load would have it
+                self.records = dict(sorted(self.records.items(),
+                                           key=lambda item: (month_key(item[1].day), item[0])))
+                if self.dirty_months:
+                    self._persist([("renumber", None, None)])  # only the touched segments are written
+            self._save_queued()
+        return len(loaded)
+
+    def migrate_csv_to_segments(self):
+        # One-shot split of an existing student_expense.csv (and its journal) into months
+        records = self._load_csv()
+        months = {}
+        for rec in records.values():
+            months.setdefault(month_key(rec.day), []).append(rec)
+        self._write_segments(months)
+        return len(records)
+
+    def _write_segments(self, months):
+        # months maps "YYYY-MM" to that month's records; an empty month is removed
+        os.makedirs(self.segment_dir, exist_ok=True)
+        segments = dict(self.segments)
+        for key, rows in sorted(months.items()):
+            path = self._segment_path(key)
+            if rows:
+                atomic_write(path, csv_payload(rows))
+                stat = os.stat(path)
+                segments[key] = segment_entry(rows)
+                segments[key].update(size=stat.st_size, mtime_ns=stat.st_mtime_ns)
+            else:
+                if os.path.exists(path):
+                    os.remove(path)
+                segments.pop(key, None)
+        self._write_manifest(segments)
+        self.file_lock.bump()
+        self.segments = segments
+
+    def copy_segment(self, year, month, path):
+        # A month export is a plain file copy of its segment
+        self.flush()
+        key = f"{year:04d}-{month:02d}"
+        if key not in self.segments:
+            atomic_write(path, csv_payload([]))
+            return 0
+        shutil.copyfile(self._segment_path(key), path)
+        return self.segments[key]["rows"]
+
+    # ---------- SQLite ----------
+    def _open_db(self):
+        if self.db_conn is None:
+            fresh = not os.path.exists(self.db_path)
+            # The GUI loads on a worker thread and saves on another, one at a time
+            self.db_conn = sqlite3.connect(self.db_path, check_same_thread=False)
+            self.db_conn.execute("PRAGMA journal_mode=WAL")
+            self.db_conn.executescript(DB_SCHEMA)
+            if fresh and os.path.exists(self.file_path):
+                self.migrate_csv_to_db()
+        return self.db_conn
+
+    def migrate_csv_to_db(self):
+        # One-shot import of an existing student_expense.csv (and its journal)
+        records = self._load_csv()
+        with self.db_conn:
+            self.db_conn.executemany(INSERT_SQL, (rec.to_row() for rec in records.values()))
+        return len(records)
+
+    def _load_db(self):
+        rows = self._open_db().execute(f"SELECT {DB_COLUMNS} FROM expenses ORDER BY id")
+        records, renumbered = assign_serials(parse_rows(rows, self.db_path, 1, "row"))
+        self.serial_mark = max(self.serial_mark, self._read_db_serial())
+        if renumbered:
+            self._log_changes([("renumber", None, None)])
+            self._write_db(records.values())
+        return records
+
+    def _read_db_serial(self):
+        row = self._open_db().execute("SELECT value FROM meta WHERE key = 'next_serial'").fetchone()
+        return row[0] if row else 1
+
+    def _write_db_serial(self, conn):
+        # The serial high-water mark, in the same transaction as the rows
+        conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('next_serial', ?)", (self._high_serial(),))
+
+    def _write_db(self, rows):
+        conn = self._open_db()
+        with conn:
+            conn.execute("DELETE FROM expenses")
+            conn.executemany(INSERT_SQL, (rec.to_row() for rec in rows))
+            self._write_db_serial(conn)
+        self.file_lock.bump()
+
+    def _record_db_changes(self, changes):
+        conn = self._open_db()
+        with conn:
+            for op, serial, rec in changes:
+                if op == "add":
+                    conn.execute(INSERT_SQL, rec.to_row())
+                elif op == "edit":
+                    conn.execute(UPDATE_SQL, [*rec.to_row(), serial])
+                elif op == "delete":
+                    conn.execute("DELETE FROM expenses WHERE serial = ?", (serial,))
+                elif op == "clear":
+                    conn.execute("DELETE FROM expenses")
+            self._write_db_serial(conn)
+        self.file_lock.bump()
+
+# ------------------- Background Saving -------------------
+class LedgerWriter:
+    # Saves a ledger's changes on a worker thread. The first unsaved change
+    # starts a delay-second window and everything submitted inside it is
+    # written in one go. A failed write keeps its changes queued: the error
+    # is handed to pop_errors() and the write is retried with the next change
+    # or flush. When idle it calls ledger.sync() every sync_every seconds
+    # (never if None).
+    def __init__(self, ledger, delay=SAVE_DELAY, sync_every=SYNC_EVERY):
+        self.ledger = ledger
+        self.delay = delay
+        self.sync_every = sync_every
+        self.cond = threading.Condition()
+        self.pending = []
+        self.errors = []
+        self.fresh = False     # changes submitted since the last write attempt
+        self.busy = False      # a batch is being written right now
+        self.flush_calls = 0   # flush() calls so far
+        self.submitted = 0     # submit() calls so far
+        self.written = 0       # submit() calls whose changes are all on disk
+        self.attempts = 0      # finished write attempts
+        self.failed = None     # error of the last attempt, None if it succeeded
+        self.closed = False
+        self.thread = threading.Thread(target=self._run, name="ledger-writer", daemon=True)
+        self.thread.start()
+
+    def submit(self, changes):
+        with self.cond:
+            self.pending.extend(changes)
+            self.submitted += 1
+            self.fresh = True
+            self.cond.notify_all()
+
+    def flush(self):
+        # Write whatever is queued now and wait for it; raises if a write
+        # attempt made meanwhile fails. Changes submitted after the call are
+        # not waited for.
+        with self.cond:
+            wanted = self.submitted
+
+            def done():
+                # also when a merge dropped every queued change as a lost conflict
+                return self.written >= wanted or (not self.pending and not self.busy)
+
+            if done():
+                return
+            self.flush_calls += 1
+            attempts = self.attempts
+            self.cond.notify_all()
+            self.cond.wait_for(lambda: done() or (self.failed is not None and self.attempts > attempts))
+            if not done():
+                raise self.failed
+
+    def close(self):
+        # One last write of anything queued, then the thread stops
+        with self.cond:
+            self.closed = True
+            self.cond.notify_all()
+        self.thread.join()
+
+    def pop_errors(self):
+        if not self.errors:
+            return []  # without waiting on a batch being taken
+        with self.cond:
+            errors, self.errors = self.errors, []
+        return errors
+
+    def _run(self):
+        ledger = self.ledger
+        flushed = 0  # flush() calls already served by a write attempt
+        while True:
+            with self.cond:
+                woken = self.cond.wait_for(
+                    lambda: self.closed or (self.pending and (self.fresh or self.flush_calls > flushed)),
+                    self.sync_every)
+                if woken and not self.pending:
+                    return
+                deadline = time.monotonic() + self.delay
+                while woken and not self.closed and self.flush_calls == flushed:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self.cond.wait(remaining)
+            if not woken:
+                try:
+                    ledger.sync()
+                except Exception:
+                    pass  # retried on the next round; a write that keeps failing is reported
+                continue
+            # The file lock is held from merging other processes' saves until
+            # the batch is written; the batch and, if needed, a copy of the
+            # ledger are then taken in one step so they agree.
+            with self.cond:
+                flushed = self.flush_calls
+                taken = self.submitted
+                self.fresh = False
+                self.busy = True
+            changes, rows, base, locked = [], None, None, False
+            try:
+                ledger.file_lock.acquire()
+                locked = True
+                ledger._sync_locked()  # may rebase self.pending
+                with ledger.lock, self.cond:
+                    taken = self.submitted  # the batch holds everything submitted so far
+                    changes, self.pending = self.pending, []
+                    rows = ledger._snapshot(len(changes))
+                    base = ledger._take_base()
+                failed = None
+            except Exception as exc:
+                failed = exc
+            try:
+                if failed is None:
+                    ledger._write_changes(changes, rows)
+                    ledger.version = ledger._storage_stamp()
+            except Exception as exc:
+                failed = exc
+            finally:
+                if locked:
+                    ledger.file_lock.release()
+            with ledger.lock, self.cond:
+                if failed is not None:
+                    self.pending[:0] = changes  # keep them, in order, for the retry
+                    if base is not None:
+                        ledger._requeue(base, rows)
+                    self.errors.append(failed)
+                else:
+                    self.written = taken
+                self.failed = failed
+                self.busy = False
+                self.attempts += 1
+                self.cond.notify_all()
+                if failed is not None and self.closed:
+                    return
+
+# ------------------- Export -------------------
+def export_month(ledger, year, month, path=None, progress=None):
+    # Raises ValueError for an invalid month; returns (path, rows written).
+    # The file only appears once complete, so an exception raised by
+    # progress() (a cancel) leaves nothing behind.
+    day_from, day_to = month_range(year, month)
+    path = path or f"export_{year}_{month}.csv"
+    if ledger.storage == "partitioned":
+        return path, ledger.copy_segment(year, month, path)
+    rows = ledger.query(day_from=day_from, day_to=day_to)
+    tmp_path = path + ".tmp"
+    try:
+        with open(tmp_path, "w", newline="", encoding="utf-8") as f:
+            writer = csv.writer(f)
+            writer.writerow(HEADER)
+            for start in range(0, len(rows), PROGRESS_ROWS):
+                writer.writerows(rec.to_row() for rec in rows[start:start + PROGRESS_ROWS])
+                if progress is not None:
+                    progress(min(start + PROGRESS_ROWS, len(rows)), len(rows))
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    return path, len(rows)
+
+# ------------------- Billing -------------------
+BILL_HEADER = ["Roll", "Student", "Records", "Meals", "Meal", "Hostel", "Electricity",
+               "Inventory", "Penalty", "Total"]
+
+def month_bills(ledger, year, month, progress=None):
+    # Every student's bill for one month from a single pass over that month's
+    # rows, sorted by roll. Raises ValueError for an invalid month.
+    day_from, day_to = month_range(year, month)
+    bills = {}
+    rows = ledger.query(day_from=day_from, day_to=day_to)
+    for done, rec in enumerate(rows, 1):
+        if progress is not None and done % PROGRESS_ROWS == 0:
+            progress(done, len(rows))
+        bill = bills.get(rec.roll)
+        if bill is None:
+            bill = bills[rec.roll] = {"roll": rec.roll, "student": rec.student, "records": 0, "meals": 0,
+                                      "mess": 0.0, "hostel": 0.0, "electricity": 0.0,
+                                      "inventory": 0.0, "penalty": 0.0}
+        bill["records"] += 1
+        bill["meals"] += rec.meal_count
+        bill["mess"] += rec.mess
+        bill["hostel"] += rec.hostel
+        bill["electricity"] += rec.electricity
+        bill["inventory"] += rec.inventory
+        bill["penalty"] += rec.penalty
+    for bill in bills.values():
+        # As in summarize(), the penalty is already part of the meal cost
+        bill["total"] = bill["mess"] + bill["hostel"] + bill["electricity"] + bill["inventory"]
+    return sorted(bills.values(), key=lambda bill: (len(bill["roll"]), bill["roll"]))
+
+def write_bill_sheet(ledger, year, month, path=None, progress=None):
+    # The consolidated bill sheet: one row per student plus a grand total.
+    # Returns (path, bills).
+    bills = month_bills(ledger, year, month, progress)
+    path = path or f"bills_{year}_{month}.csv"
+    keys = ["records", "meals", "mess", "hostel", "electricity", "inventory", "penalty", "total"]
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(BILL_HEADER)
+        for bill in bills:
+            writer.writerow([bill["roll"], bill["student"]] + [round(bill[key], 2) for key in keys])
+        writer.writerow(["Total", len(bills)] + [round(sum(bill[key] for bill in bills), 2) for key in keys])
+    return path, bills
+
+# ------------------- Bulk Export -------------------
+def write_export_file(path, rows, compress=False, statement=False):
+    # One month or one student to CSV (gzip when compress); a statement ends
+    # with a Total row. Returns rows written.
+    opener = gzip.open if compress else open
+    with opener(path, "wt", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(HEADER)
+        writer.writerows(rec.to_row() for rec in rows)
+        if statement and rows:
+            writer.writerow(["Total", rows[0].roll, rows[0].student, "", "", "",
+                             sum(rec.meal_count for rec in rows), sum(rec.mess for rec in rows),
+                             sum(rec.hostel for rec in rows), sum(rec.electricity for rec in rows),
+                             sum(rec.inventory for rec in rows)])
+    return len(rows)
+
+def export_worker(path, fields, compress, statement):
+    # Pool entry point: the rows arrive as Expense.astuple() tuples
+    return write_export_file(path, [Expense(*values) for values in fields], compress, statement)
+
+def export_jobs(ledger, out_dir, months=True, students=True, compress=False):
+    # Yields (path, rows, statement) one file at a time, straight off the indexes
+    suffix = ".csv.gz" if compress else ".csv"
+    if months:
+        keys = ledger.index.by_day
+        start = 0
+        while start < len(keys):
+            first = date.fromordinal(keys[start][0])
+            _, last = month_range(first.year, first.month)
+            end = bisect_left(keys, (last + 1,), start)
+            yield (os.path.join(out_dir, "months", month_key(keys[start][0]) + suffix),
+                   [key[2] for key in keys[start:end]], False)
+            start = end
+    if students:
+        for roll in sorted(ledger.index.by_roll):
+            name = "".join(c if c.isalnum() or c in "-_" else "_" for c in roll) or "_"
+            yield (os.path.join(out_dir, "students", name + suffix),
+                   [key[2] for key in ledger.index.by_roll[roll]], True)
+
+def export_all(ledger, out_dir, months=True, students=True, compress=False, workers=None, progress=None):
+    # Every month and every student statement, written by a process pool
+    # (workers=None uses every CPU, 0 or 1 writes in this process). Only a
+    # few files' rows are in flight at once. progress(rows_done, rows_total)
+    # follows each finished file. Returns files, rows, seconds, rows_per_sec.
+    report = progress or (lambda done, total: None)
+    started = time.perf_counter()
+    ledger.load_months()  # statements cover the whole history
+    for folder, wanted in (("months", months), ("students", students)):
+        if wanted:
+            os.makedirs(os.path.join(out_dir, folder), exist_ok=True)
+    total = len(ledger.records) * (int(months) + int(students))
+    counts = {"done": 0, "files": 0}
+
+    def finished(rows):
+        counts["done"] += rows
+        counts["files"] += 1
+        report(counts["done"], total)
+
+    jobs = export_jobs(ledger, out_dir, months, students, compress)
+    workers = (os.cpu_count() or 1) if workers is None else workers
+    if workers <= 1:
+        for path, rows, statement in jobs:
+            finished(write_export_file(path, rows, compress, statement))
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            running = set()
+            for path, rows, statement in jobs:
+                fields = [rec.astuple() for rec in rows]
+                running.add(pool.submit(export_worker, path, fields, compress, statement))
+                if len(running) >= 2 * workers:
+                    done, running = wait(running, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        finished(future.result())
+            for future in as_completed(running):
+                finished(future.result())
+    seconds = time.perf_counter() - started
+    return {"files": counts["files"], "rows": counts["done"], "seconds": seconds,
+            "rows_per_sec": counts["done"] / seconds if seconds > 0 else 0.0}
+
+# ------------------- Incremental Export -------------------
+CHANGE_HEADER = ["Change"] + HEADER  # Change is "upsert" or "delete" (only Serial is filled)
+
+def export_changes(ledger, out_dir=CHANGES_DIR, progress=None):
+    # Writes what was added, edited or deleted since the last call to the
+    # next batch file in out_dir and adds it to out_dir/manifest.json. The
+    # watermark is a position in the ledger's change log, so a batch costs
+    # time in proportion to the changes, not to the ledger. The log is only
+    # kept from the first export on, and only as far back as some export
+    # folder still needs. The first batch, and the one after a Clear All
+    # Data or a lost log, is "full": every row, replacing whatever was
+    # exported before. Returns the batch's manifest entry, or None when
+    # nothing changed.
+    started = time.perf_counter()
+    manifest_path = os.path.join(out_dir, MANIFEST_NAME)
+    log = os.path.abspath(ledger.changes_path)
+    manifest = {"log": log, "offset": 0, "batches": []}
+    if os.path.exists(manifest_path):
+        with open(manifest_path, encoding="utf-8") as f:
+            manifest = json.load(f)
+    offset = manifest["offset"] if manifest["batches"] and manifest["log"] == log else None
+    ledger.flush()  # this process's own changes must be logged first
+    with ledger.file_lock:
+        # Merged with other stations in the same step, so every change read
+        # from the log is already in the records
+        ledger._sync_locked()
+        entries, end = ledger.changes_since(offset) if offset is not None else (None, 0)
+        # A clear, or serials handed out afresh, cannot be told apart from edits
+        full = entries is None or any(op in ("clear", "renumber") for op, _, _ in entries)
+        if full:
+            ledger.start_changes_log()
+            end = ledger.changes_end()
+            with ledger.lock:
+                loaded = list(ledger.records.values())
+                unloaded = sorted(key for key in ledger.segments if key not in ledger.loaded_months)
+    if full:
+        # Months not loaded are read straight from their segments
+        rows = [["upsert"] + rec.to_row() for rec in loaded]
+        with ledger.file_lock:
+            for key in unloaded:
+                if os.path.exists(ledger._segment_path(key)):  # gone if another station cleared since
+                    rows.extend(["upsert"] + rec.to_row() for rec in ledger._read_segment(key))
+        entries = entries or []
+    else:
+        if not entries:
+            return None
+        changed = {}
+        for op, serial, day in entries:
+            changed[serial] = day
+        for day in {day for day in changed.values() if day is not None}:
+            ledger.load_months(day, day)  # an edited record may sit in a month not loaded yet
+        with ledger.lock:
+            rows = [["upsert"] + ledger.records[serial].to_row() if serial in ledger.records
+                    else ["delete", serial] + [""] * (len(HEADER) - 1) for serial in sorted(changed)]
+
+    os.makedirs(out_dir, exist_ok=True)
+    number = len(manifest["batches"]) + 1
+    name = f"batch_{number:05d}.csv"
+    path = os.path.join(out_dir, name)
+    tmp_path = path + ".tmp"
+    try:
+        with open(tmp_path, "w", newline="", encoding="utf-8") as f:
+            writer = csv.writer(f)
+            writer.writerow(CHANGE_HEADER)
+            for start in range(0, len(rows), PROGRESS_ROWS):
+                writer.writerows(rows[start:start + PROGRESS_ROWS])
+                if progress is not None:
+                    progress(min(start + PROGRESS_ROWS, len(rows)), len(rows))
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    deletes = sum(1 for row in rows if row[0] == "delete")
+    batch = {"batch": number, "file": name, "kind": "full" if full else "changes",
+             "created": datetime.now().strftime("%Y-%m-%d %H:%M:%S"), "changes": len(entries),
+             "upserts": len(rows) - deletes, "deletes": deletes, "log_from": 0 if full else offset,
+             "log_to": end, "seconds": round(time.perf_counter() - started, 3)}
+    manifest.update(log=log, offset=end)
+    manifest["batches"].append(batch)
+    atomic_write(manifest_path, json.dumps(manifest, indent=2).encode("utf-8"))
+    # After the manifest: a crash in between only keeps more of the log
+    ledger.trim_changes_log(out_dir, end)
+    return batch
@@ -0,0 +1,144 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# Long actions run here instead of inside Tk callbacks. Threads rather than
+# processes: jobs read and change the open ledger, which cannot be sent to
+# another process (export-all still fans its files out to a process pool).
+WORKERS = 2          # a long export does not hold up a quick summary
+KEEP_FINISHED = 20   # finished jobs still listed in the Jobs window
+
+class JobCancelled(Exception):
+    pass
+
+class Job:
+    # One queued or running action. The work reports progress through
+    # progress(), which is also where a cancel takes effect; work that never
+    # reports finishes normally and its result is dropped. A job that is not
+    # cancellable can only be cancelled while it is still queued.
+    def __init__(self, number, name, func, args, on_done, on_error, cancellable):
+        self.number = number
+        self.name = name
+        self.func = func
+        self.args = args
+        self.on_done = on_done
+        self.on_error = on_error
+        self.cancellable = cancellable
+        self.state = "queued"   # queued, running, done, failed, cancelled
+        self.done = 0
+        self.total = 0          # 0 while the size of the work is unknown
+        self.label = ""
+        self.result = None
+        self.error = None
+        self.cancel_requested = False
+        self.started = None
+        self.finished = None
+
+    def progress(self, done, total, label=None):
+        self.done, self.total = done, total
+        if label is not None:
+            self.label = label
+        if self.cancel_requested:
+            raise JobCancelled()
+
+    @property
+    def fraction(self):
+        # None while the size of the work is unknown
+        return min(self.done / self.total, 1.0) if self.total else None
+
+    @property
+    def can_cancel(self):
+        return not self.cancel_requested and (self.state == "queued" or
+                                              (self.state == "running" and self.cancellable))
+
+    @property
+    def active(self):
+        return self.state in ("queued", "running")
+
+    def elapsed(self):
+        if self.started is None:
+            return 0.0
+        return (self.finished or time.monotonic()) - self.started
+
+class JobRunner:
+    # A thread pool plus the list of jobs it has been given. Nothing here
+    # touches Tk: the GUI calls poll() from root.after(), and the callbacks
+    # of finished jobs run there, on the Tk thread.
+    def __init__(self, workers=WORKERS):
+        self.pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="hostel-job")
+        self.lock = threading.Lock()
+        self.jobs = []        # oldest first
+        self.finished = []    # finished since the last poll()
+        self.count = 0
+
+    def submit(self, name, func, *args, on_done=None, on_error=None, cancellable=True):
+        # func(job, *args) runs on a pool thread; on_done(result) or
+        # on_error(exc) is called from poll()
+        with self.lock:
+            self.count += 1
+            job = Job(self.count, name, func, args, on_done, on_error, cancellable)
+            self.jobs.append(job)
+        self.pool.submit(self._run, job)
+        return job
+
+    def cancel(self, job):
+        with self.lock:
+            if not job.can_cancel:
+                return
+            job.cancel_requested = True
+            if job.state == "queued":
+                self._finish(job, "cancelled")  # _run() will skip it
+
+    def cancel_all(self):
+        for job in self.active():
+            self.cancel(job)
+
+    def active(self):
+        with self.lock:
+            return [job for job in self.jobs if job.active]
+
+    def listed(self):
+        with self.lock:
+            return list(self.jobs)
+
+    def poll(self):
+        # Runs the callbacks of jobs finished since the last call and returns those jobs
+        with self.lock:
+            finished, self.finished = self.finished, []
+            done = [job for job in self.jobs if not job.active]
+            for job in done[:max(len(done) - KEEP_FINISHED, 0)]:
+                self.jobs.remove(job)
+        for job in finished:
+            if job.state == "done" and job.on_done is not None:
+                job.on_done(job.result)
+            elif job.state == "failed" and job.on_error is not None:
+                job.on_error(job.error)
+        return finished
+
+    def shutdown(self):
+        # Cancels everything and waits for running jobs to stop
+        self.cancel_all()
+        self.pool.shutdown(wait=True)
+
+    def _run(self, job):
+        with self.lock:
+            if job.state != "queued":
+                return
+            job.state = "running"
+            job.started = time.monotonic()
+        state = "done"
+        try:
+            job.result = job.func(job, *job.args)
+            if job.cancel_requested:
+                state, job.result = "cancelled", None
+        except JobCancelled:
+            state = "cancelled"
+        except Exception as exc:
+            state, job.error = "failed", exc
+        with self.lock:
+            self._finish(job, state)
+
+    def _finish(self, job, state):
+        job.state = state
+        job.finished = time.monotonic()
+        self.finished.append(job)
@@ -1,97 +1,75 @@
 import tkinter as tk
-from tkinter import ttk, messagebox
+from tkinter import ttk, messagebox as tk_messagebox
 import csv
 import os
-from datetime import datetime
-import matplotlib.pyplot as plt
-
-FILE_PATH = "student_expense.csv"
-
-# ------------------- Data Handling -------------------
-def load_data():
-    data_list = []
-    if os.path.exists(FILE_PATH):
-        with open(FILE_PATH, "r", newline="", encoding="utf-8") as f:
-            reader = csv.reader(f)
-            next(reader, None)
-            for row in reader:
-                data_list.append(row)
-    return data_list
-
-def save_data():
-    with open(FILE_PATH, "w", newline="", encoding="utf-8") as f:
-        writer = csv.writer(f)
-        writer.writerow(["Serial", "Roll", "Student", "Date", "Religion", "PrayerDone",
-                         "MealCount", "Mess", "Hostel", "Electricity", "Inventory"])
-        for row in data:
-            writer.writerow(row)
-
-def has_fixed_cost(roll):
-    for row in data:
-        if row[1] == roll and (float(row[8]) > 0 or float(row[9]) > 0 or float(row[10]) > 0):
-            return True
-    return False
+import threading
+import time
+from datetime import date, datetime
+from itertools import islice
+from types import SimpleNamespace
+
+import hostel_jobs
+import hostel_perf
+import hostel_trends
+from hostel_core import (MAX_USUAL_MEALS, FileLock, Ledger, build_expense, export_changes, export_month,
+                         filter_range, meal_count_warning, month_range, write_bill_sheet)
+from hostel_perf import timed, untimed
+
+# Time spent waiting on a dialog is not counted against the handler that opened it
+messagebox = SimpleNamespace(**{name: untimed(getattr(tk_messagebox, name))
+                                for name in ("showinfo", "showwarning", "showerror", "askyesno")})
+
+STARTED_AT = time.perf_counter()
+
+# "full" puts every row in the Treeview; "virtual" only materializes the rows
+# in view plus TABLE_BUFFER; "auto" goes virtual above VIRTUAL_THRESHOLD rows.
+TABLE_MODE = os.environ.get("HOSTEL_TABLE", "auto")
+VIRTUAL_THRESHOLD = 5000
+TABLE_BUFFER = 10
+ROW_HEIGHT = 25
+
+STARTUP_LOG = "startup_times.csv"  # one row per launch: when, records, load and ready seconds
+
+CHART_HEADROOM = 1.15  # y axis top as a multiple of the tallest bar
 
 # ------------------- Add Expense -------------------
+@timed("add_expense")
 def add_expense():
-    global edit_index
+    global edit_serial
     roll = roll_entry.get().strip()
     student = student_name.get().strip()
     religion = religion_var.get()
     prayer_done = prayer_var.get()
-    meal_count = meal_count_entry.get().strip()
-    meal_count_str = meal_count_entry.get().strip()
+    meal_count = meal_count_entry.get()
     try:
-        meal_count = int(meal_count_str or 1)
-    except ValueError:
-        messagebox.showwarning("Warning", "Enter a valid number for meal count!")
+        rec = build_expense(roll, student, religion, prayer_done, meal_count, mess_entry.get(),
+                            hostel_entry.get(), electricity_entry.get(), inventory_entry.get())
+    except ValueError as exc:
+        messagebox.showwarning("Warning", str(exc))
         return
 
-    if meal_count > 10:
-        response = messagebox.askyesno(
-            "High Meal Count",
-            f"Meal count is {meal_count}, which is unusually high.\nDo you want to proceed?"
-        )
+    warning = meal_count_warning(meal_count)
+    if warning is not None:
+        response = messagebox.askyesno("High Meal Count", f"{warning}\nDo you want to proceed?")
         if not response:
             return
 
-    if not roll or not student or not religion or not prayer_done:
-        messagebox.showwarning("Warning", "All required fields must be filled!")
-        return
-    try:
-        mess = float(mess_entry.get() or 0)
-        hostel = float(hostel_entry.get() or 0)
-        electricity = float(electricity_entry.get() or 0)
-        inventory = float(inventory_entry.get() or 0)
-        meal_count = int(meal_count or 1)
-    except ValueError:
-        messagebox.showwarning("Warning", "Enter valid numeric values!")
-        return
-
-    if prayer_done == "No":
-        meal_count += 1
-    mess *= meal_count
-
-    if edit_index is not None:
-        data[edit_index] = [
-            edit_index + 1, roll, student, datetime.now().strftime("%Y-%m-%d"),
-            religion, prayer_done, meal_count, mess, hostel, electricity, inventory
-        ]
-        edit_index = None
+    if edit_serial is not None:
+        serial, edit_serial = edit_serial, None
         add_button.config(text="Add Expense")
+        if serial not in ledger.records:
+            messagebox.showwarning("Warning", "The record being edited no longer exists!")
+            return
+        ledger.replace(serial, rec)
+        table_update(rec)
         messagebox.showinfo("Success", "Record updated successfully!")
     else:
-        serial = len(data) + 1
-        data.append([
-            serial, roll, student, datetime.now().strftime("%Y-%m-%d"),
-            religion, prayer_done, meal_count, mess, hostel, electricity, inventory
-        ])
+        ledger.insert(rec)  # assigns the next free serial
+        table_add(rec)
         messagebox.showinfo("Success", "New expense added!")
 
-    save_data()
-    update_table()
-
     # Clear all entries
+    roll_status_var.set("")
     roll_entry.delete(0, tk.END)
     student_name.delete(0, tk.END)
     religion_var.set('')
@@ -101,76 +79,177 @@ def add_expense():
     # hostel_entry.delete(0, tk.END)
     # electricity_entry.delete(0, tk.END)
     # inventory_entry.delete(0, tk.END)
-    total_students_var.set(f"Total Students: {len(data)}")
-    total_cost_var.set(f"Total Cost Today: {sum([float(row[7])+float(row[8])+float(row[9])+float(row[10]) for row in data]):.2f}৳")
+    refresh_header()
+
+def refresh_header():
+    total_students_var.set(f"Total Students: {ledger.student_count()}")
+    total_cost_var.set(f"Total Cost Today: {ledger.totals.day_total(date.today().toordinal()):.2f}৳")
+
+# ------------------- Daily Meal Grid -------------------
+def show_meal_grid():
+    # Today's meals for every known student in one window. Typing a count
+    # and then y/n sets the prayer status, Enter/Down and Up move between
+    # rows, and everything entered is checked and saved together.
+    rolls = ledger.known_rolls()
+    if not rolls:
+        messagebox.showwarning("Warning", "No students yet! Add a first expense for each student.")
+        return
+    today = date.today().toordinal()
+    entered_today = {rec.roll for rec in ledger.query(None, today, today)}
 
-# ------------------- Update Table -------------------
-def update_table():
-    for row in tree.get_children():
-        tree.delete(row)
-    for row in data:
-        tree.insert("", tk.END, values=row)
+    popup = tk.Toplevel(root)
+    popup.title(f"Daily Meals - {date.today().isoformat()}")
+    popup.geometry("760x600")
+    popup.configure(bg=theme["bg"])
+
+    top = tk.Frame(popup, bg=theme["bg"])
+    top.pack(fill=tk.X, padx=10, pady=8)
+    tk.Label(top, text="Meal Expenses", font=header_font, bg=theme["bg"], fg=theme["fg"]).pack(side=tk.LEFT)
+    rate_entry = tk.Entry(top, font=entry_font, width=10)
+    rate_entry.insert(0, mess_entry.get())
+    rate_entry.pack(side=tk.LEFT, padx=5)
+    tk.Label(top, text="Count then y/n for prayer, Enter for the next row. Blank rows are skipped.",
+             font=("Helvetica", 9), bg=theme["bg"], fg=theme["fg"]).pack(side=tk.LEFT, padx=10)
+
+    body = tk.Frame(popup, bg=theme["bg"])
+    body.pack(fill=tk.BOTH, expand=True, padx=10)
+    grid_canvas = tk.Canvas(body, bg=theme["bg"], highlightthickness=0)
+    grid_scroll = ttk.Scrollbar(body, orient="vertical", command=grid_canvas.yview)
+    grid_canvas.configure(yscrollcommand=grid_scroll.set)
+    grid_scroll.pack(side=tk.RIGHT, fill=tk.Y)
+    grid_canvas.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+    grid = tk.Frame(grid_canvas, bg=theme["bg"])
+    grid_canvas.create_window((0, 0), window=grid, anchor="nw")
+    grid.bind("<Configure>", lambda event: grid_canvas.configure(scrollregion=grid_canvas.bbox("all")))
+
+    for column, title in enumerate(["Roll", "Student", "Religion", "Prayer Done?", "Meal Count", ""]):
+        tk.Label(grid, text=title, font=header_font, bg=theme["bg"], fg=theme["fg"]).grid(
+            row=0, column=column, padx=5, pady=2, sticky="w")
+
+    rows = []  # (roll, name, religion, prayer_var, meal_entry)
+
+    def move(position, step):
+        target = position + step
+        if 0 <= target < len(rows):
+            rows[target][4].focus_set()
+            grid_canvas.yview_moveto(max(0.0, (target - 5) / len(rows)))
+        return "break"
+
+    def set_prayer(prayer, answer):
+        prayer.set(answer)
+        return "break"
+
+    for position, roll in enumerate(rolls):
+        name, religion = ledger.student_info(roll)
+        prayer = tk.StringVar(value="Yes")
+        row = position + 1
+        tk.Label(grid, text=roll, font=entry_font, bg=theme["bg"], fg=theme["fg"]).grid(row=row, column=0, padx=5, sticky="w")
+        tk.Label(grid, text=name, font=entry_font, bg=theme["bg"], fg=theme["fg"]).grid(row=row, column=1, padx=5, sticky="w")
+        tk.Label(grid, text=religion, font=entry_font, bg=theme["bg"], fg=theme["fg"]).grid(row=row, column=2, padx=5, sticky="w")
+        ttk.Combobox(grid, textvariable=prayer, state="readonly", values=["Yes", "No"], width=6).grid(row=row, column=3, padx=5)
+        meal = tk.Entry(grid, font=entry_font, width=8)
+        meal.grid(row=row, column=4, padx=5, pady=1)
+        for key in ("<Return>", "<Down>"):
+            meal.bind(key, lambda event, position=position: move(position, 1))
+        meal.bind("<Up>", lambda event, position=position: move(position, -1))
+        for key, answer in (("y", "Yes"), ("Y", "Yes"), ("n", "No"), ("N", "No")):
+            meal.bind(f"<KeyPress-{key}>", lambda event, prayer=prayer, answer=answer: set_prayer(prayer, answer))
+        if roll in entered_today:
+            tk.Label(grid, text="entered today", font=("Helvetica", 9), bg=theme["bg"], fg="#888").grid(
+                row=row, column=5, padx=5, sticky="w")
+        rows.append((roll, name, religion, prayer, meal))
+
+    @timed("save_meal_grid")
+    def save_grid():
+        # Every row is checked before anything is saved, then one write and one table refresh
+        records, errors, high = [], [], []
+        for roll, name, religion, prayer, meal in rows:
+            text = meal.get().strip()
+            if not text:
+                continue
+            try:
+                rec = build_expense(roll, name, religion, prayer.get(), text, rate_entry.get())
+            except ValueError as exc:
+                errors.append(f"Roll {roll}: {exc}")
+                continue
+            if meal_count_warning(text) is not None:
+                high.append(roll)
+            records.append(rec)
+        if errors:
+            more = f"\n...and {len(errors) - 15} more" if len(errors) > 15 else ""
+            messagebox.showwarning("Warning", "\n".join(errors[:15]) + more, parent=popup)
+            return
+        if not records:
+            messagebox.showwarning("Warning", "Enter a meal count for at least one student!", parent=popup)
+            return
+        if high and not messagebox.askyesno(
+                "High Meal Count",
+                f"Roll {', '.join(high)} has a meal count above {MAX_USUAL_MEALS}, which is unusually high.\n"
+                "Do you want to proceed?", parent=popup):
+            return
+        ledger.insert_many(records)
+        update_table()
+        refresh_header()
+        popup.destroy()
+        show_toast(f"Saved {len(records)} meal entries")
+
+    buttons = tk.Frame(popup, bg=theme["bg"])
+    buttons.pack(fill=tk.X, padx=10, pady=8)
+    tk.Button(buttons, text="Save All", command=save_grid, bg="#4CAF50", fg="white",
+              font=header_font, width=14).pack(side=tk.RIGHT, padx=5)
+    tk.Button(buttons, text="Cancel", command=popup.destroy, bg="#F44336", fg="white",
+              font=header_font, width=10).pack(side=tk.RIGHT, padx=5)
+    popup.bind("<Control-s>", lambda event: save_grid())
+    popup.bind("<Escape>", lambda event: popup.destroy())
+    rows[0][4].focus_set()
 
 # ------------------- Show Student Summary -------------------
+@timed("show_student_summary")
 def show_student_summary():
     roll = summary_roll.get().strip()
     date_filter = summary_date.get().strip()
     month_filter = summary_month.get().strip()
     year_filter = summary_year.get().strip()
+    from_filter = summary_from.get().strip()
+    to_filter = summary_to.get().strip()
 
     if not roll:
         messagebox.showwarning("Warning", "Enter Roll number!")
         return
 
     # Must provide at least one filter besides roll
-    if not (date_filter or month_filter or year_filter):
-        messagebox.showwarning("Warning", "Enter at least Date, Month, or Year to search!")
+    if not (date_filter or month_filter or year_filter or from_filter or to_filter):
+        messagebox.showwarning("Warning", "Enter at least Date, Month, Year or a From/To range to search!")
         return
 
-    # Filter by roll
-    student_data = [row for row in data if row[1] == roll]
+    try:
+        day_from, day_to, month_only = filter_range(date_filter, month_filter, year_filter, from_filter, to_filter)
+    except ValueError as exc:
+        messagebox.showwarning("Warning", str(exc))
+        return
+    shown = len(ledger.records)
 
-    # Apply optional filters
-    if date_filter:
-        try:
-            parsed_date = datetime.strptime(date_filter, "%Y-%m-%d").date()
-            student_data = [row for row in student_data if datetime.strptime(row[3], "%Y-%m-%d").date() == parsed_date]
-        except ValueError:
-            messagebox.showwarning("Warning", "Enter Date in YYYY-MM-DD format!")
-            return
+    def summary_loaded(summary):
+        if len(ledger.records) != shown:
+            update_table()  # older months were loaded for this summary
+        show_summary_popup(roll, summary)
 
-    if month_filter:
-        try:
-            month_int = int(month_filter)
-            student_data = [row for row in student_data if datetime.strptime(row[3], "%Y-%m-%d").month == month_int]
-        except ValueError:
-            messagebox.showwarning("Warning", "Enter a valid Month (1-12)!")
-            return
-    if year_filter:
-        try:
-            year_int = int(year_filter)
-            student_data = [row for row in student_data if datetime.strptime(row[3], "%Y-%m-%d").year == year_int]
-        except ValueError:
-            messagebox.showwarning("Warning", "Enter a valid Year (YYYY)!")
-            return
+    # Cached for whole months, but older months may have to be read first
+    run_job(f"Summary for roll {roll}", lambda job: ledger.student_summary(roll, day_from, day_to, month_only),
+            summary_loaded, timer="student_summary_job")
 
-    if not student_data:
+def show_summary_popup(roll, summary):
+    if summary is None:
         messagebox.showinfo("Info", "No data found for the given filter!")
         return
 
-    # --- Remaining code same as before ---
-    total_mess = total_hostel = total_electricity = total_inventory = total_penalty = 0
-    student_name_val = student_data[0][2]
-
-    for row in student_data:
-        total_mess += float(row[7])
-        total_hostel += float(row[8])
-        total_electricity += float(row[9])
-        total_inventory += float(row[10])
-        if row[5] == "No":
-            total_penalty += float(row[7]) / int(row[6])
-
-    total_all = total_mess + total_hostel + total_electricity + total_inventory
+    student_name_val = summary["student"]
+    total_mess = summary["mess"]
+    total_hostel = summary["hostel"]
+    total_electricity = summary["electricity"]
+    total_inventory = summary["inventory"]
+    total_penalty = summary["penalty"]
+    total_all = summary["total"]
 
     # Popup code 
     popup = tk.Toplevel(root)
@@ -200,40 +279,106 @@ def show_student_summary():
     def on_popup_close():
         categories = ["Meal", "Hostel", "Electricity", "Inventory", "Penalty"]
         values = [total_mess, total_hostel, total_electricity, total_inventory, total_penalty]
-        plt.bar(categories, values, color=['#4CAF50', '#2196F3', '#FF9800', '#F44336', '#9C27B0'])
-        plt.title(f"{student_name_val} (Roll {roll}) Expense Summary")
-        plt.ylabel("Amount (BDT)")
-        plt.show()
+        get_chart_panel().show(f"{student_name_val} (Roll {roll}) Expense Summary", categories, values,
+                               ['#4CAF50', '#2196F3', '#FF9800', '#F44336', '#9C27B0'], "Amount (BDT)")
 
     popup.protocol("WM_DELETE_WINDOW", lambda: (popup.destroy(), on_popup_close()))
     tk.Button(popup, text="Close", command=lambda: (popup.destroy(), on_popup_close()),
               font=("Helvetica", 12, "bold"), bg="#ff9800", fg="white", width=15).pack(pady=10)
 
+@timed("show_overall_chart")
 def show_overall_chart():
-    if not data:
+    if not ledger.records:
         messagebox.showinfo("Info", "No data available to show chart!")
         return
 
-    total_mess = total_hostel = total_electricity = total_inventory = 0
-
-    for row in data:
-        try:
-            total_mess += float(row[7])
-            total_hostel += float(row[8])
-            total_electricity += float(row[9])
-            total_inventory += float(row[10])
-        except ValueError:
-            continue
-
     categories = ["Meal", "Hostel", "Electricity", "Inventory"]
-    values = [total_mess, total_hostel, total_electricity, total_inventory]
-
-    plt.figure(figsize=(6, 5))
-    plt.bar(categories, values, color=["#4CAF50", "#2196F3", "#FF9800", "#F44336"])
-    plt.title("Overall Expense Summary (All Students)")
-    plt.ylabel("Total Amount (BDT)")
-    plt.tight_layout()
-    plt.show()
+    get_chart_panel().show_async("Overall Expense Summary (All Students)", categories, ledger.category_totals,
+                                 ["#4CAF50", "#2196F3", "#FF9800", "#F44336"], "Total Amount (BDT)")
+
+# ------------------- Chart Panel -------------------
+class ChartPanel:
+    # One Agg figure embedded beside the table and reused by every chart, so
+    # no pyplot windows, event loops or leaked figures. Bars are animated
+    # artists: when a chart comes back with the same bars and scale, only
+    # the bars whose value changed get new heights and the bars are redrawn
+    # over the cached axes background and blitted, with no full figure draw.
+    def __init__(self, parent):
+        # matplotlib is only needed for charts, so it is imported on the first one
+        from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
+        from matplotlib.figure import Figure
+
+        self.frame = tk.Frame(parent, bg=theme["bg"])
+        self.figure = Figure(figsize=(4.5, 3.6), dpi=100, layout="tight")
+        self.axes = self.figure.add_subplot()
+        self.canvas = FigureCanvasTkAgg(self.figure, master=self.frame)
+        self.canvas.get_tk_widget().pack(fill=tk.BOTH, expand=True)
+        self.canvas.mpl_connect("draw_event", self.on_draw)
+        tk.Button(self.frame, text="Hide Chart", command=self.hide, bg="#ff9800", fg="white",
+                  font=("Helvetica", 10, "bold")).pack(pady=4)
+        self.bars = []
+        self.layout = None       # (title, labels, ylabel) the axes were drawn for
+        self.background = None   # axes without the bars, captured after each full draw
+        self.request = 0         # newest show_async() call, older results are dropped
+        self.visible = False
+
+    def show(self, title, labels, values, colors, ylabel):
+        if not self.visible:
+            self.frame.pack(side=tk.RIGHT, fill=tk.Y, before=scrollbar)
+            self.visible = True
+        values = [float(value) for value in values]
+        top = self.axes.get_ylim()[1]
+        tallest = max(values, default=0.0)
+        same_scale = tallest <= top and tallest * CHART_HEADROOM * 2 > top
+        if self.layout != (title, list(labels), ylabel) or not same_scale or self.background is None:
+            self.axes.clear()
+            self.bars = list(self.axes.bar(labels, values, color=colors, animated=True))
+            self.axes.set_ylim(0, (tallest or 1.0) * CHART_HEADROOM)
+            self.axes.set_title(title, fontsize=10)
+            self.axes.set_ylabel(ylabel)
+            self.layout = (title, list(labels), ylabel)
+            self.canvas.draw()  # on_draw caches the background and adds the bars
+            return
+        changed = False
+        for bar, value in zip(self.bars, values):
+            if bar.get_height() != value:
+                bar.set_height(value)
+                changed = True
+        if changed:
+            self.canvas.restore_region(self.background)
+            self.draw_bars()
+
+    def show_async(self, title, labels, compute, colors, ylabel):
+        # compute() runs as a background job; the chart is drawn once it returns
+        self.request += 1
+        request = self.request
+
+        def computed(values):
+            if request == self.request:
+                self.show(title, labels, values, colors, ylabel)
+
+        run_job(title, lambda job: compute(), computed, timer="chart_job")
+
+    def on_draw(self, event):
+        self.background = self.canvas.copy_from_bbox(self.axes.bbox)
+        self.draw_bars()
+
+    def draw_bars(self):
+        for bar in self.bars:
+            self.axes.draw_artist(bar)
+        self.canvas.blit(self.axes.bbox)
+
+    def hide(self):
+        self.frame.pack_forget()
+        self.visible = False
+
+chart_panel = None
+
+def get_chart_panel():
+    global chart_panel
+    if chart_panel is None:
+        chart_panel = ChartPanel(table_frame)
+    return chart_panel
 
 def show_notice():
     notice_win = tk.Toplevel(root)
@@ -305,8 +450,8 @@ def show_feedback_popup():
     def submit_feedback():
         feedback = feedback_entry.get("1.0", tk.END).strip()
         if feedback:
-            with open("feedback.csv", "a", encoding="utf-8", newline="") as f:
-                writer = csv.writer(f)
+            with FileLock("feedback.csv.lock"), open("feedback.csv", "a", encoding="utf-8", newline="") as f:
+                writer = csv.writer(f)  # other stations append to the same file
                 writer.writerow([datetime.now().strftime("%Y-%m-%d %H:%M:%S"), feedback])
             popup.destroy()
             show_toast("Feedback submitted. Thank you!")
@@ -316,15 +461,228 @@ def show_feedback_popup():
     tk.Button(popup, text="Submit", command=submit_feedback,
               bg="#4CAF50", fg="white", font=("Helvetica",11,"bold")).pack(pady=10)
 
+# ------------------- Diagnostics -------------------
+def show_diagnostics():
+    win = tk.Toplevel(root)
+    win.title("Diagnostics")
+    win.geometry("760x520")
+    win.configure(bg=theme["bg"])
+
+    toggle_text = tk.StringVar()
+    button_bar = tk.Frame(win, bg=theme["bg"])
+    button_bar.pack(fill=tk.X, padx=10, pady=8)
+    report_text = tk.Text(win, font=("Consolas", 9), wrap="none")
+    report_text.pack(fill=tk.BOTH, expand=True, padx=10, pady=(0, 10))
+
+    def refresh():
+        toggle_text.set("Stop Timing" if hostel_perf.state["enabled"] else "Start Timing")
+        report_text.config(state="normal")
+        report_text.delete("1.0", tk.END)
+        cache = ledger.summaries
+        looked_up = cache.hits + cache.misses
+        report_text.insert(tk.END, hostel_perf.report([
+            f"Summary cache: {len(cache.entries)} entries, {cache.hits} hits, {cache.misses} misses"
+            + (f" ({cache.hits * 100 / looked_up:.0f}% hit rate)" if looked_up else "")]))
+        report_text.config(state="disabled")
+
+    def refresh_live():
+        # Live while the window is open
+        if win.winfo_exists():
+            refresh()
+            win.after(1000, refresh_live)
+
+    def toggle_timing():
+        hostel_perf.set_enabled(not hostel_perf.state["enabled"])
+        refresh()
+
+    def reset_timing():
+        hostel_perf.reset()
+        ledger.summaries.hits = ledger.summaries.misses = 0
+        refresh()
+
+    def save_report():
+        show_toast(f"Timings saved to {hostel_perf.dump()}")
+
+    def profile_next():
+        hostel_perf.profile_next_action()
+        show_toast("The next action will be profiled")
+        refresh()
+
+    for text, command in [("Start Timing", toggle_timing), ("Reset", reset_timing),
+                          ("Save to File", save_report), ("Profile Next Action", profile_next)]:
+        button = tk.Button(button_bar, text=text, command=command, bg="#607D8B", fg="white",
+                           font=("Helvetica", 10, "bold"), padx=8)
+        button.pack(side=tk.LEFT, padx=4)
+        if command is toggle_timing:
+            button.config(textvariable=toggle_text)
+    refresh_live()
+
+# ------------------- Trends -------------------
+def show_trends():
+    try:
+        hostel_trends.load_numpy()
+    except RuntimeError as exc:
+        messagebox.showwarning("Warning", f"{exc}.")
+        return
+    from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
+    from matplotlib.figure import Figure
+
+    win = tk.Toplevel(root)
+    win.title("Trends")
+    win.geometry("900x680")
+    win.configure(bg=theme["bg"])
+    trends = hostel_trends.TrendData(ledger)  # columns are built once, then reused until the ledger changes
+
+    controls = tk.Frame(win, bg=theme["bg"])
+    controls.pack(fill=tk.X, padx=10, pady=8)
+    tk.Label(controls, text="Roll (blank = whole hostel)", font=header_font, bg=theme["bg"], fg=theme["fg"]).pack(side=tk.LEFT)
+    trend_roll = tk.Entry(controls, font=entry_font, width=10)
+    trend_roll.pack(side=tk.LEFT, padx=5)
+    metric_var = tk.StringVar(value=hostel_trends.METRICS["meals"])
+    ttk.Combobox(controls, textvariable=metric_var, state="readonly", width=14,
+                 values=list(hostel_trends.METRICS.values())).pack(side=tk.LEFT, padx=5)
+    view_var = tk.StringVar(value="Daily")
+    ttk.Combobox(controls, textvariable=view_var, state="readonly", width=9,
+                 values=["Daily", "Monthly"]).pack(side=tk.LEFT, padx=5)
+
+    figure = Figure(figsize=(8.5, 3.8), dpi=100, layout="tight")
+    axes = figure.add_subplot()
+    canvas = FigureCanvasTkAgg(figure, master=win)
+    canvas.get_tk_widget().pack(fill=tk.BOTH, expand=True, padx=10)
+    details = tk.Text(win, height=13, font=("Consolas", 9))
+    details.pack(fill=tk.X, padx=10, pady=(5, 10))
+
+    def draw():
+        # Building the columns reads the whole ledger, so it runs as a job
+        run_job("Trends", lambda job: trends.refresh(), plot, timer="trends_job")
+
+    @timed("show_trends")
+    def plot(data):
+        if not win.winfo_exists():
+            return
+        roll = trend_roll.get().strip() or None
+        metric = next(key for key, label in hostel_trends.METRICS.items() if label == metric_var.get())
+        months, monthly = hostel_trends.monthly_series(data, metric, roll)
+        axes.clear()
+        if view_var.get() == "Daily":
+            days, daily = hostel_trends.daily_series(data, metric, roll)
+            x = (days - hostel_trends.EPOCH).astype("datetime64[D]")
+            axes.plot(x, daily, color="#90CAF9", linewidth=0.8, label="Daily")
+            axes.plot(x, hostel_trends.rolling_mean(daily), color="#1565C0",
+                      label=f"{hostel_trends.ROLLING_DAYS}-day average")
+        else:
+            axes.bar(months.astype("datetime64[M]"), monthly, width=20, color="#4CAF50", label="Monthly")
+        axes.set_title(f"{metric_var.get()} - {f'Roll {roll}' if roll else 'Whole hostel'}")
+        if len(months):
+            axes.legend(loc="upper left")
+        canvas.draw()
+
+        change = hostel_trends.month_over_month(monthly)
+        lines = [f"{'Month':9}{metric_var.get():>16}{'vs previous':>14}"]
+        for month, total, pct in list(zip(months, monthly, change))[-6:]:
+            shown = "" if pct != pct else f"{pct:+.1f}%"  # NaN when the month before had nothing
+            lines.append(f"{hostel_trends.month_label(month):9}{total:>16.2f}{shown:>14}")
+        if not roll and len(months):
+            first, last = month_range(*map(int, hostel_trends.month_label(months[-1]).split("-")))
+            lines += ["", f"Top {hostel_trends.TOP_N} by {metric_var.get().lower()} in {hostel_trends.month_label(months[-1])}:"]
+            for top_roll, total in hostel_trends.top_consumers(data, metric, day_from=first, day_to=last):
+                name = (ledger.student_info(top_roll) or ("",))[0]
+                lines.append(f"  {top_roll:>8}  {name:24}{total:>12.2f}")
+        details.config(state="normal")
+        details.delete("1.0", tk.END)
+        details.insert(tk.END, "\n".join(lines) if len(months) else "No data found for the given filter!")
+        details.config(state="disabled")
+
+    tk.Button(controls, text="Show", command=draw, bg="#3F51B5", fg="white",
+              font=header_font, width=10).pack(side=tk.LEFT, padx=5)
+    trend_roll.bind("<Return>", lambda event: draw())
+    draw()
+
+# ------------------- Background Jobs -------------------
+def run_job(name, work, on_done=None, cancellable=True, timer=None):
+    # work(job) runs on a job thread and must not touch Tk; on_done(result)
+    # runs back on the Tk thread once it finishes. Failures are shown here.
+    def failed(exc):
+        messagebox.showerror("Job Failed", f"{name} failed: {exc}")
+    work = timed(timer)(work) if timer else work
+    return jobs.submit(name, hostel_perf.profile_job(timer or "job", work), on_done=on_done, on_error=failed,
+                       cancellable=cancellable)
+
+def job_status(job):
+    if job.state == "running":
+        if job.cancel_requested:
+            return "Cancelling..."
+        fraction = job.fraction
+        shown = f"{fraction * 100:.0f}%" if fraction is not None else f"{job.elapsed():.1f}s"
+        return f"{job.label or 'Running'} {shown}"
+    if job.state == "done":
+        return f"Done in {job.elapsed():.1f}s"
+    if job.state == "failed":
+        return f"Failed: {job.error}"
+    return job.state.capitalize()
+
+def show_jobs():
+    win = tk.Toplevel(root)
+    win.title("Jobs")
+    win.geometry("640x380")
+    win.configure(bg=theme["bg"])
+
+    button_bar = tk.Frame(win, bg=theme["bg"])
+    button_bar.pack(fill=tk.X, padx=10, pady=8)
+    tk.Button(button_bar, text="Cancel All", command=jobs.cancel_all, bg="#F44336", fg="white",
+              font=("Helvetica", 10, "bold"), padx=8).pack(side=tk.LEFT, padx=4)
+    body = tk.Frame(win, bg=theme["bg"])
+    body.pack(fill=tk.BOTH, expand=True, padx=10, pady=(0, 10))
+    empty = tk.Label(body, text="No jobs yet.", font=entry_font, bg=theme["bg"], fg=theme["fg"])
+    rows = {}  # job number -> (frame, progress bar, status label, cancel button)
+
+    def refresh():
+        listed = jobs.listed()
+        numbers = {job.number for job in listed}
+        for number in [number for number in rows if number not in numbers]:
+            rows.pop(number)[0].destroy()
+        for job in listed:
+            if job.number not in rows:
+                frame = tk.Frame(body, bg=theme["bg"])
+                frame.pack(fill=tk.X, pady=3)
+                tk.Label(frame, text=job.name, font=header_font, width=28, anchor="w",
+                         bg=theme["bg"], fg=theme["fg"]).pack(side=tk.LEFT)
+                bar = ttk.Progressbar(frame, length=160, maximum=100)
+                bar.pack(side=tk.LEFT, padx=5)
+                status = tk.Label(frame, font=entry_font, width=24, anchor="w", bg=theme["bg"], fg=theme["fg"])
+                status.pack(side=tk.LEFT, padx=5)
+                cancel = tk.Button(frame, text="Cancel", command=lambda job=job: jobs.cancel(job),
+                                   bg="#ff9800", fg="white", font=("Helvetica", 9, "bold"))
+                cancel.pack(side=tk.RIGHT)
+                rows[job.number] = (frame, bar, status, cancel)
+            _, bar, status, cancel = rows[job.number]
+            fraction = job.fraction
+            if job.state == "running" and fraction is None:
+                bar.config(mode="indeterminate")
+                bar.step(8)  # keeps moving while the size of the work is unknown
+            else:
+                bar.config(mode="determinate", value=100 if job.state == "done" else (fraction or 0) * 100)
+            status.config(text=job_status(job))
+            cancel.config(state="normal" if job.can_cancel else "disabled")
+        if listed:
+            empty.pack_forget()
+        else:
+            empty.pack(pady=20)
+
+    def refresh_live():
+        # Live while the window is open
+        if win.winfo_exists():
+            refresh()
+            win.after(200, refresh_live)
+
+    refresh_live()
+
 def show_toast(msg, duration=2000):
     toast = tk.Label(root, text=msg, bg="#333", fg="white", font=("Helvetica",10), bd=1, relief="solid")
     toast.place(relx=0.5, rely=0.05, anchor="n")
     root.after(duration, lambda: toast.destroy())
 
 # ------------------- GUI -------------------
-import tkinter as tk
-import time
-
 # ---------- Splash Screen ----------
 splash = tk.Tk()
 splash.overrideredirect(True)
@@ -364,15 +722,40 @@ progress = tk.Label(splash, text="", font=("Consolas", 12),
                     fg="#00FF00", bg="#1E1E2F")
 progress.place(relx=0.5, rely=0.8, anchor="center")
 
-def animate_progress():
-    for i in range(1, 21):
-        progress.config(text="█" * i)
-        splash.update()
-        time.sleep(0.09)
-    splash.destroy()
+# The ledger loads on a worker thread; the splash polls its real progress
+# and closes as soon as loading is done.
+load_state = {"fraction": 0.0, "label": "Loading...", "ledger": None, "error": None}
 
-splash.after(700, animate_progress)
+def report_load_progress(fraction, label):
+    load_state["fraction"] = fraction
+    load_state["label"] = label
+
+def load_in_background():
+    try:
+        load_state["ledger"] = Ledger().load(progress=report_load_progress)
+    except Exception as exc:
+        load_state["error"] = exc
+
+def poll_loading():
+    progress.config(text="█" * int(load_state["fraction"] * 20))
+    loading_label.config(text=load_state["label"])
+    if loader.is_alive():
+        splash.after(30, poll_loading)
+    else:
+        splash.destroy()
+
+loader = threading.Thread(target=load_in_background, daemon=True)
+loader.start()
+splash.after(30, poll_loading)
 splash.mainloop()
+loader.join()
+if load_state["error"] is not None:
+    if isinstance(load_state["error"], ValueError):
+        tk_messagebox.showerror("Cannot Load Ledger", str(load_state["error"]))  # unreadable rows
+    raise load_state["error"]
+ledger = load_state["ledger"]
+ledger.start_writer()  # saves happen off the Tk thread from here on
+loaded_at = time.perf_counter()
 
 # ---------- Main Window ----------
 root = tk.Tk()
@@ -384,12 +767,46 @@ def daily_reminder():
     messagebox.showinfo("Reminder", "Remember to submit today’s meal count before 10 PM!")
 root.after(1000, daily_reminder)
 
+seen_merges = 0
+
+def poll_ledger():
+    # The writer thread cannot touch Tk, so its failures are collected here,
+    # along with the changes of other stations it merged in. Nothing here
+    # reads the files.
+    global seen_merges
+    errors = ledger.writer.pop_errors()
+    if errors:
+        messagebox.showerror("Save Failed", f"Could not save the latest changes: {errors[-1]}\n"
+                                            "They are kept and saving is retried with the next change.")
+    if ledger.merges != seen_merges:
+        seen_merges = ledger.merges
+        update_table()
+        refresh_header()
+    conflicts = ledger.pop_conflicts()
+    if conflicts:
+        shown = ", ".join(str(serial) for serial in conflicts[:10]) + (" ..." if len(conflicts) > 10 else "")
+        messagebox.showwarning("Changes Not Saved", f"Another station saved changes to record(s) {shown} first.\n"
+                                                    "Their version was kept and the change made here was discarded.")
+    root.after(500, poll_ledger)
+root.after(500, poll_ledger)
+
+jobs = hostel_jobs.JobRunner()
+
+def poll_jobs():
+    # Finished jobs hand their results to the Tk thread here
+    for job in jobs.poll():
+        if job.state == "cancelled":
+            show_toast(f"{job.name} cancelled")
+    active = len(jobs.active())
+    jobs_button.config(text=f"Jobs ({active})" if active else "Jobs")
+    root.after(100, poll_jobs)
+root.after(100, poll_jobs)
+
 root.title("Hostel & Mess Management System")
 root.state("zoomed")
 
 theme = {"bg": "#f0f4f7", "fg": "black"}
 root.configure(bg=theme["bg"])
-data = load_data()
 
 header_font = ("Helvetica", 10, "bold")
 entry_font = ("Helvetica", 9)
@@ -426,6 +843,12 @@ def show_exit_splash():
             exit_splash.after(50, lambda: fade(alpha-5))
         else:
             exit_splash.destroy()
+            jobs.shutdown()  # cancels what it can and waits for the rest
+            try:
+                ledger.compact()  # wait for queued saves, then fold the journal back into the CSV
+            except Exception as exc:
+                messagebox.showerror("Save Failed", f"Some changes could not be saved: {exc}")
+            ledger.close()
             root.quit()
 
     exit_splash.after(2000, fade)
@@ -502,6 +925,16 @@ tk.Button(header_frame, text="Help", command=show_help,
 tk.Button(header_frame, text="Change Theme", command=toggle_theme,
           bg="#2196F3", fg="white", font=("Helvetica", 12, "bold"),padx=10, pady=3).pack(side=tk.RIGHT, padx=10)
 
+tk.Button(header_frame, text="Diagnostics", command=show_diagnostics,
+          bg="#607D8B", fg="white", font=("Helvetica", 12, "bold"), padx=10, pady=3).pack(side=tk.RIGHT, padx=10)
+
+jobs_button = tk.Button(header_frame, text="Jobs", command=show_jobs,
+                        bg="#795548", fg="white", font=("Helvetica", 12, "bold"), padx=10, pady=3)
+jobs_button.pack(side=tk.RIGHT, padx=10)
+
+tk.Button(header_frame, text="Trends", command=show_trends,
+          bg="#009688", fg="white", font=("Helvetica", 12, "bold"), padx=10, pady=3).pack(side=tk.RIGHT, padx=10)
+
 # ------------------- Add Feedback Button in Header -------------------
 tk.Button(header_frame, text="Feedback", command=show_feedback_popup,
           bg="#FF5722", fg="white", font=("Helvetica", 12, "bold"), padx=10, pady=3).pack(side=tk.RIGHT, padx=10)
@@ -509,8 +942,9 @@ tk.Button(header_frame, text="Feedback", command=show_feedback_popup,
 info_frame = tk.Frame(root, bg=theme["bg"])
 info_frame.pack(fill=tk.X, padx=20, pady=5)
 
-total_students_var = tk.StringVar(value=f"Total Students: {len(data)}")
-total_cost_var = tk.StringVar(value=f"Total Cost Today: {sum([float(row[7])+float(row[8])+float(row[9])+float(row[10]) for row in data]):.2f}৳")
+total_students_var = tk.StringVar()
+total_cost_var = tk.StringVar()
+refresh_header()
 
 tk.Label(info_frame, textvariable=total_students_var, font=("Helvetica",12,"bold"), bg="#4CAF50", fg="white", padx=10, pady=5).pack(side=tk.LEFT, padx=5)
 tk.Label(info_frame, textvariable=total_cost_var, font=("Helvetica",12,"bold"), bg="#2196F3", fg="white", padx=10, pady=5).pack(side=tk.LEFT, padx=5)
@@ -571,48 +1005,80 @@ add_button.grid(row=2, column=5, padx=10, pady=5)
 tk.Button(entry_frame, text="Show Overall Cost", command=show_overall_chart,
           bg="#FF5722", fg="white", font=header_font, width=20, pady=5).grid(row=2, column=6, padx=10, pady=5)
 
-edit_index = None  # global variable to track edited row
+tk.Button(entry_frame, text="Daily Meals", command=show_meal_grid,
+          bg="#009688", fg="white", font=header_font, width=14, pady=5).grid(row=2, column=7, padx=10, pady=5)
+
+roll_status_var = tk.StringVar()
+tk.Label(entry_frame, textvariable=roll_status_var, font=entry_font, bg=theme["bg"], fg=theme["fg"]).grid(
+    row=2, column=2, columnspan=3, padx=5, pady=2, sticky="w")
+autofilled = {"student": "", "religion": ""}  # what fill_from_roll() last put in the form
+
+def fill_from_roll(event=None):
+    # A known roll fills in the name and religion unless staff typed their own;
+    # an unknown one takes back what was filled in
+    roll = roll_entry.get().strip()
+    info = ledger.student_info(roll) if roll else None
+    name, religion = info or ("", "")
+    if student_name.get().strip() in ("", autofilled["student"]):
+        student_name.delete(0, tk.END)
+        student_name.insert(0, name)
+    if religion_var.get() in ("", autofilled["religion"]):
+        religion_var.set(religion)
+    autofilled.update(student=name, religion=religion)
+    if info is None:
+        roll_status_var.set("New student" if roll else "")
+        return
+    paid = "already paid" if ledger.has_fixed_cost(roll) else "not paid yet"
+    roll_status_var.set(f"{name}: one-time charges {paid}")
+
+roll_entry.bind("<KeyRelease>", fill_from_roll)
+
+edit_serial = None  # serial of the record being edited
 
 def edit_record():
-    global edit_index
+    global edit_serial
     selected = tree.selection()
     if not selected:
         messagebox.showwarning("Warning", "Select a row first!")
         return
-    edit_index = tree.index(selected[0])  # Get index of selected row in Treeview
-    item = data[edit_index]
+    item = selected_record()
+    edit_serial = item.serial
 
     # Populate entries with selected row
     roll_entry.delete(0, tk.END)
-    roll_entry.insert(0, item[1])
+    roll_entry.insert(0, item.roll)
     student_name.delete(0, tk.END)
-    student_name.insert(0, item[2])
-    religion_var.set(item[4])
-    prayer_var.set(item[5])
+    student_name.insert(0, item.student)
+    religion_var.set(item.religion)
+    prayer_var.set(item.prayer_done)
     meal_count_entry.delete(0, tk.END)
-    meal_count_entry.insert(0, item[6])
+    meal_count_entry.insert(0, item.meal_count)
     mess_entry.delete(0, tk.END)
-    mess_entry.insert(0, item[7])
+    mess_entry.insert(0, item.mess)
     hostel_entry.delete(0, tk.END)
-    hostel_entry.insert(0, item[8])
+    hostel_entry.insert(0, item.hostel)
     electricity_entry.delete(0, tk.END)
-    electricity_entry.insert(0, item[9])
+    electricity_entry.insert(0, item.electricity)
     inventory_entry.delete(0, tk.END)
-    inventory_entry.insert(0, item[10])
+    inventory_entry.insert(0, item.inventory)
 
     add_button.config(text="Save Changes")  # change button text
 
+@timed("delete_record")
 def delete_record():
     selected = tree.selection()
     if not selected:
         messagebox.showwarning("Warning", "Select a row first!")
         return
-    item_index = tree.index(selected[0])  # Use index instead of item value
-    item = data[item_index]
-    if messagebox.askyesno("Confirm Delete", f"Delete record for Roll {item[1]}?"):
-        data.pop(item_index)  # remove by index
-        save_data()
-        update_table()
+    item = selected_record()
+    if messagebox.askyesno("Confirm Delete", f"Delete record for Roll {item.roll}?"):
+        if ledger.records.get(item.serial) is not item:
+            messagebox.showwarning("Warning", "This record was just changed at another station, nothing was deleted.")
+            update_table()
+            return
+        ledger.remove(item.serial)
+        table_remove(item)
+        refresh_header()
         messagebox.showinfo("Info", "Record deleted successfully!")
 
 # ------------------- Right-Click Menu -------------------
@@ -637,7 +1103,7 @@ style = ttk.Style()
 style.theme_use("clam")
 style.configure("Treeview",
                 font=("Helvetica", 9),
-                rowheight=25,
+                rowheight=ROW_HEIGHT,
                 fieldbackground="white")
 style.configure("Treeview.Heading",
                 font=header_font,
@@ -647,22 +1113,123 @@ style.configure("Treeview.Heading",
 tree.tag_configure('oddrow', background='#e0e0e0')
 tree.tag_configure('evenrow', background='#ffffff')
 
+table_virtual = False
+table_offset = 0  # position in the ledger of the first row shown by the virtual table
+
+def wants_virtual_table():
+    return TABLE_MODE == "virtual" or (TABLE_MODE == "auto" and len(ledger.records) > VIRTUAL_THRESHOLD)
+
+def stripe(position):
+    return 'evenrow' if position % 2 == 0 else 'oddrow'
+
+@timed("update_table")
 def update_table():
-    for row in tree.get_children():
-        tree.delete(row)
-    for i, row in enumerate(data):
-        tag = 'evenrow' if i % 2 == 0 else 'oddrow'
-        tree.insert("", tk.END, values=row, tags=(tag,))
+    global table_virtual
+    table_virtual = wants_virtual_table()
+    tree.delete(*tree.get_children())
+    if table_virtual:
+        # The scrollbar tracks table_offset over the whole ledger, not the tree's few items
+        tree.configure(yscrollcommand="")
+        render_window()
+        return
+    tree.configure(yscrollcommand=scrollbar.set)
+    for i, rec in enumerate(list(ledger.records.values())):  # the writer may merge in other stations' saves
+        tree.insert("", tk.END, iid=str(rec.serial), values=rec.to_row(), tags=(stripe(i),))
+
+# Single-row updates; in the full table each item id is the record's serial
+def table_add(rec):
+    if table_virtual:
+        render_window()
+    elif wants_virtual_table():
+        update_table()  # the ledger just grew past VIRTUAL_THRESHOLD
+    else:
+        tree.insert("", tk.END, iid=str(rec.serial), values=rec.to_row(), tags=(stripe(len(ledger.records) - 1),))
+
+def table_update(rec):
+    if table_virtual:
+        render_window()
+        return
+    tree.item(str(rec.serial), values=rec.to_row())
+
+def table_remove(rec):
+    if table_virtual:
+        render_window()
+        return
+    position = tree.index(str(rec.serial))
+    tree.delete(str(rec.serial))
+    # Only the rows below the deleted one change parity
+    items = tree.get_children()
+    for i in range(position, len(items)):
+        tree.item(items[i], tags=(stripe(i),))
+
+def visible_rows():
+    return max(1, tree.winfo_height() // ROW_HEIGHT - 1)  # minus the heading row
+
+def render_window():
+    # Reuse the materialized items, only their values change while scrolling
+    global table_offset
+    shown = visible_rows()
+    table_offset = max(0, min(table_offset, len(ledger.records) - shown))
+    rows = list(islice(ledger.records.values(), table_offset, table_offset + shown + TABLE_BUFFER))
+    items = tree.get_children()
+    for i, rec in enumerate(rows):
+        tag = stripe(table_offset + i)
+        if i < len(items):
+            tree.item(items[i], values=rec.to_row(), tags=(tag,))
+        else:
+            tree.insert("", tk.END, values=rec.to_row(), tags=(tag,))
+    if len(items) > len(rows):
+        tree.delete(*items[len(rows):])
+    tree.yview_moveto(0)
+    if ledger.records:
+        scrollbar.set(table_offset / len(ledger.records), min(1.0, (table_offset + shown) / len(ledger.records)))
+    else:
+        scrollbar.set(0.0, 1.0)
+
+def scroll_table(*args):
+    global table_offset
+    if not table_virtual:
+        tree.yview(*args)
+        return
+    if args[0] == "moveto":
+        table_offset = int(float(args[1]) * len(ledger.records))
+    elif args[0] == "scroll":
+        step = visible_rows() if args[2] == "pages" else 1
+        table_offset += int(args[1]) * step
+    render_window()
+
+def on_table_wheel(event):
+    if not table_virtual:
+        return None
+    direction = -1 if event.num == 4 or event.delta > 0 else 1
+    scroll_table("scroll", 3 * direction, "units")
+    return "break"
+
+def on_table_resize(event):
+    if table_virtual:
+        render_window()
+
+def selected_record():
+    selected = tree.selection()
+    if not selected:
+        return None
+    if table_virtual:
+        return next(islice(ledger.records.values(), table_offset + tree.index(selected[0]), None))
+    return ledger.records[int(selected[0])]
 
 for col in columns:
     tree.heading(col, text=col)
     tree.column(col, anchor='center', width=100, stretch=True)
 
 tree.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
-scrollbar = ttk.Scrollbar(table_frame, orient="vertical", command=tree.yview)
+scrollbar = ttk.Scrollbar(table_frame, orient="vertical", command=scroll_table)
 tree.configure(yscroll=scrollbar.set)
 scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
 tree.bind("<Button-3>", popup_menu)
+tree.bind("<MouseWheel>", on_table_wheel)
+tree.bind("<Button-4>", on_table_wheel)
+tree.bind("<Button-5>", on_table_wheel)
+tree.bind("<Configure>", on_table_resize)
 update_table()
 
 # ------------------- Summary Frame -------------------
@@ -689,11 +1256,20 @@ tk.Label(summary_frame, text="Year (YYYY):", font=header_font, bg=theme["bg"], f
 summary_year = tk.Entry(summary_frame, font=entry_font)
 summary_year.grid(row=0, column=7, padx=5, pady=5, sticky="ew")
 
+tk.Label(summary_frame, text="From (YYYY-MM-DD):", font=header_font, bg=theme["bg"], fg=theme["fg"]).grid(row=1, column=0, padx=5, pady=5, sticky="e")
+summary_from = tk.Entry(summary_frame, font=entry_font)
+summary_from.grid(row=1, column=1, padx=5, pady=5, sticky="ew")
+
+tk.Label(summary_frame, text="To (YYYY-MM-DD):", font=header_font, bg=theme["bg"], fg=theme["fg"]).grid(row=1, column=2, padx=5, pady=5, sticky="e")
+summary_to = tk.Entry(summary_frame, font=entry_font)
+summary_to.grid(row=1, column=3, padx=5, pady=5, sticky="ew")
+
 # Buttons in separate row (original width)
 tk.Button(summary_frame, text="Show Summary & Chart", command=show_student_summary,
-          bg="#ff9800", fg="white", font=("Helvetica", 11, "bold"), width=20, pady=6).grid(row=1, column=0, padx=5, pady=10, sticky="w")          
+          bg="#ff9800", fg="white", font=("Helvetica", 11, "bold"), width=20, pady=6).grid(row=2, column=0, padx=5, pady=10, sticky="w")          
 
 # ------------------- New Buttons: Export Month & Clear -------------------
+@timed("export_month_data")
 def export_month_data():
     month_filter = summary_month.get().strip()
     year_filter = summary_year.get().strip()
@@ -709,39 +1285,105 @@ def export_month_data():
         messagebox.showwarning("Warning", "Enter valid Month and Year!")
         return
 
-    export_file = f"export_{year_int}_{month_int}.csv"
-    with open(export_file, "w", newline="", encoding="utf-8") as f:
-        writer = csv.writer(f)
-        writer.writerow(["Serial", "Roll", "Student", "Date", "Religion", "PrayerDone",
-                         "MealCount", "Mess", "Hostel", "Electricity", "Inventory"])
-        for row in data:
-            row_date = datetime.strptime(row[3], "%Y-%m-%d")
-            if row_date.year == year_int and row_date.month == month_int:
-                writer.writerow(row)
-    messagebox.showinfo("Success", f"Month data exported to {export_file}")
+    try:
+        month_range(year_int, month_int)
+    except ValueError:
+        messagebox.showwarning("Warning", "Enter valid Month and Year!")
+        return
+    run_job(f"Export {month_int}/{year_int}",
+            lambda job: export_month(ledger, year_int, month_int, progress=job.progress),
+            lambda result: show_toast(f"Month data exported to {result[0]}", 4000), timer="export_month_job")
+
+@timed("bill_month")
+def bill_month():
+    month_filter = summary_month.get().strip()
+    year_filter = summary_year.get().strip()
+
+    if not month_filter or not year_filter:
+        messagebox.showwarning("Warning", "Please enter Month and Year to bill!")
+        return
+
+    try:
+        year_int, month_int = int(year_filter), int(month_filter)
+        month_range(year_int, month_int)
+    except ValueError:
+        messagebox.showwarning("Warning", "Enter valid Month and Year!")
+        return
+
+    def billed(result):
+        bill_file, bills = result
+        if not bills:
+            show_toast("No data found for that month!", 4000)
+            return
+        total = sum(bill["total"] for bill in bills)
+        show_toast(f"Bills for {len(bills)} students ({total:.2f} BDT) saved to {bill_file}", 4000)
+
+    run_job(f"Bills {month_int}/{year_int}",
+            lambda job: write_bill_sheet(ledger, year_int, month_int, progress=job.progress),
+            billed, timer="bill_month_job")
+
+@timed("export_changes_data")
+def export_changes_data():
+    def exported(batch):
+        if batch is None:
+            show_toast("Nothing changed since the last export")
+        elif batch["kind"] == "full":
+            show_toast(f"Full export of {batch['upserts']} rows saved to {batch['file']}", 4000)
+        else:
+            show_toast(f"{batch['upserts']} new or changed and {batch['deletes']} deleted rows "
+                       f"saved to {batch['file']}", 4000)
+
+    run_job("Export changes", lambda job: export_changes(ledger, progress=job.progress), exported,
+            timer="export_changes_job")
 
+@timed("clear_all_data")
 def clear_all_data():
-    global data
-    if messagebox.askyesno("Confirm", "Are you sure you want to clear all data?"):
-        data = []
-        save_data()
+    if not messagebox.askyesno("Confirm", "Are you sure you want to clear all data?"):
+        return
+
+    def clear(job):
+        ledger.clear()
+        try:
+            ledger.flush()  # the toast comes once the clear is on disk
+        except Exception:
+            pass  # poll_ledger() reports it and the save is retried
+
+    def cleared(result):
         update_table()
-        messagebox.showinfo("Info", "All data cleared successfully!")
+        refresh_header()
+        show_toast("All data cleared successfully!")
+
+    # A clear cannot be stopped halfway, so only a queued one can be cancelled
+    run_job("Clear all data", clear, cleared, cancellable=False, timer="clear_all_data_job")
 
 tk.Button(summary_frame, text="Export Month Data", command=export_month_data,
-          bg="#4CAF50", fg="white", font=("Helvetica", 11, "bold"), width=18, pady=6).grid(row=1, column=1, padx=5, pady=10, sticky="w")
+          bg="#4CAF50", fg="white", font=("Helvetica", 11, "bold"), width=18, pady=6).grid(row=2, column=1, padx=5, pady=10, sticky="w")
           
-# Empty column to create space between left and right buttons
-tk.Label(summary_frame, text="", bg=theme["bg"]).grid(row=1, column=2, padx=50)
+tk.Button(summary_frame, text="Month-End Bills", command=bill_month,
+          bg="#3F51B5", fg="white", font=("Helvetica", 11, "bold"), width=18, pady=6).grid(row=2, column=2, padx=5, pady=10, sticky="w")
 
 tk.Button(summary_frame, text="Clear All Data", command=clear_all_data,
-          bg="#F44336", fg="white", font=("Helvetica", 11, "bold"), width=18, pady=6).grid(row=1, column=3, padx=5, pady=10, sticky="e")
+          bg="#F44336", fg="white", font=("Helvetica", 11, "bold"), width=18, pady=6).grid(row=2, column=3, padx=5, pady=10, sticky="e")
 
 # Notice Board button next to Clear All Data
 notice_button = tk.Button(summary_frame, text="Notice Board",
                           command=lambda: show_notice(),
                           bg="#F44336", fg="white", font=("Helvetica", 11, "bold"), width=18, pady=6)
-notice_button.grid(row=1, column=4, padx=5, pady=10, sticky="w")
+notice_button.grid(row=2, column=4, padx=5, pady=10, sticky="w")
+
+tk.Button(summary_frame, text="Export Changes", command=export_changes_data,
+          bg="#4CAF50", fg="white", font=("Helvetica", 11, "bold"), width=18, pady=6).grid(row=2, column=5, padx=5, pady=10, sticky="w")
+
+def report_startup():
+    # Time-to-interactive: process start until the main window first goes idle
+    ready_at = time.perf_counter()
+    print(f"Startup: ledger loaded in {loaded_at - STARTED_AT:.2f}s, "
+          f"interactive after {ready_at - STARTED_AT:.2f}s ({len(ledger.records)} records)")
+    with FileLock(STARTUP_LOG + ".lock"), open(STARTUP_LOG, "a", encoding="utf-8", newline="") as f:
+        csv.writer(f).writerow([datetime.now().strftime("%Y-%m-%d %H:%M:%S"), len(ledger.records),
+                                f"{loaded_at - STARTED_AT:.3f}", f"{ready_at - STARTED_AT:.3f}"])
+
+root.after_idle(report_startup)
 
 # Run
 root.mainloop()
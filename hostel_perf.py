@@ -0,0 +1,170 @@
+import cProfile
+import io
+import json
+import os
+import pstats
+import threading
+import time
+from datetime import datetime
+from functools import wraps
+
+# Opt-in timing of the app's handlers and ledger I/O. Off unless HOSTEL_PERF=1
+# or switched on from the Diagnostics window; when off a timed call costs one
+# flag check.
+ENABLED = os.environ.get("HOSTEL_PERF") == "1"
+BUCKETS_MS = [1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000]  # histogram upper bounds
+PROFILE_LINES = 25
+
+state = {"enabled": ENABLED, "profile_next": False, "profile": None}
+stats = {}  # name -> LatencyStats
+lock = threading.Lock()  # the ledger's writer thread records saves too
+local = threading.local()
+
+class LatencyStats:
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.buckets = [0] * (len(BUCKETS_MS) + 1)  # the last one is "slower than every bound"
+
+    def record(self, seconds):
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+        ms = seconds * 1000
+        for i, bound in enumerate(BUCKETS_MS):
+            if ms < bound:
+                self.buckets[i] += 1
+                return
+        self.buckets[-1] += 1
+
+    def percentile(self, fraction):
+        # Upper bound of the bucket holding that share of calls (max for the last one)
+        wanted = fraction * self.count
+        seen = 0
+        for i, count in enumerate(self.buckets):
+            seen += count
+            if count and seen >= wanted:
+                return BUCKETS_MS[i] / 1000 if i < len(BUCKETS_MS) else self.max
+        return 0.0
+
+    def as_dict(self):
+        histogram = {f"<{bound}": n for bound, n in zip(BUCKETS_MS, self.buckets)}
+        histogram[f">={BUCKETS_MS[-1]}"] = self.buckets[-1]
+        return {"count": self.count, "total_s": self.total, "mean_ms": self.total * 1000 / max(self.count, 1),
+                "p50_ms": self.percentile(0.5) * 1000, "p95_ms": self.percentile(0.95) * 1000,
+                "max_ms": self.max * 1000, "histogram_ms": histogram}
+
+# ------------------- Recording -------------------
+def timed(name):
+    # Decorator: counts and times each call under name. The outermost timed
+    # call on the Tk thread after profile_next_action() also runs under
+    # cProfile, unless it hands its work to a job (see profile_job).
+    def decorate(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            if not state["enabled"]:
+                return func(*args, **kwargs)
+            depth = getattr(local, "depth", 0)
+            profiler = None
+            if depth == 0 and state["profile_next"] and threading.current_thread() is threading.main_thread():
+                state["profile_next"] = False
+                profiler = cProfile.Profile()
+                local.profiling, local.handed = True, False
+            local.depth = depth + 1
+            waited = getattr(local, "waited", 0.0)
+            started = time.perf_counter()
+            try:
+                if profiler is not None:
+                    return profiler.runcall(func, *args, **kwargs)
+                return func(*args, **kwargs)
+            finally:
+                elapsed = time.perf_counter() - started - (getattr(local, "waited", 0.0) - waited)
+                local.depth = depth
+                with lock:
+                    stats.setdefault(name, LatencyStats()).record(elapsed)
+                if profiler is not None:
+                    local.profiling = False
+                    if not local.handed:
+                        keep_profile(name, profiler)
+        return wrapper
+    return decorate
+
+def profile_job(name, func):
+    # Called on the Tk thread when an action starts a job. If that action is
+    # the one being profiled, func is profiled on the job thread instead,
+    # since the action itself only queued the work.
+    if not getattr(local, "profiling", False) or local.handed:
+        return func
+    local.handed = True
+
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        profiler = cProfile.Profile()
+        try:
+            return profiler.runcall(func, *args, **kwargs)
+        finally:
+            keep_profile(name, profiler)
+    return wrapper
+
+def untimed(func):
+    # For calls that wait on the user, like dialogs: their time is taken off
+    # every timed call they happen inside
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        if not state["enabled"] or not getattr(local, "depth", 0):
+            return func(*args, **kwargs)
+        started = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            local.waited = getattr(local, "waited", 0.0) + time.perf_counter() - started
+    return wrapper
+
+def set_enabled(enabled):
+    state["enabled"] = enabled
+
+def reset():
+    with lock:
+        stats.clear()
+    state["profile"] = None
+
+def profile_next_action():
+    state["enabled"] = True
+    state["profile_next"] = True
+
+def keep_profile(name, profiler):
+    out = io.StringIO()
+    pstats.Stats(profiler, stream=out).sort_stats("cumulative").print_stats(PROFILE_LINES)
+    path = f"profile_{name}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.prof"
+    profiler.dump_stats(path)  # for snakeviz / pstats
+    state["profile"] = {"name": name, "path": path, "text": out.getvalue()}
+
+# ------------------- Reporting -------------------
+def snapshot():
+    with lock:
+        return {name: entry.as_dict() for name, entry in sorted(stats.items())}
+
+def report(notes=()):
+    # notes: extra lines shown under the table, like the app's cache counters
+    lines = [f"{'handler':22}{'calls':>7}{'mean ms':>10}{'p50 ms':>9}{'p95 ms':>9}{'max ms':>10}{'total s':>9}"]
+    for name, entry in snapshot().items():
+        lines.append(f"{name:22}{entry['count']:>7}{entry['mean_ms']:>10.2f}{entry['p50_ms']:>9.0f}"
+                     f"{entry['p95_ms']:>9.0f}{entry['max_ms']:>10.2f}{entry['total_s']:>9.2f}")
+        shown = [f"{bucket}:{n}" for bucket, n in entry["histogram_ms"].items() if n]
+        lines.append("    " + "  ".join(shown))
+    if len(lines) == 1:
+        lines.append("No calls recorded yet." if state["enabled"] else
+                     "Instrumentation is off. Turn it on here or start with HOSTEL_PERF=1.")
+    if notes:
+        lines += [""] + list(notes)
+    profile = state["profile"]
+    if profile is not None:
+        lines += ["", f"Profile of {profile['name']} (saved to {profile['path']}):", profile["text"]]
+    return "\n".join(lines)
+
+def dump(path=None):
+    path = path or f"perf_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump({"created": datetime.now().strftime("%Y-%m-%d %H:%M:%S"), "handlers": snapshot()}, f, indent=2)
+    return path
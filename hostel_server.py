@@ -0,0 +1,254 @@
+import argparse
+import asyncio
+import json
+import sys
+from urllib.parse import parse_qsl
+
+from hostel_core import FILE_PATH, Ledger, build_expense, meal_count_warning
+
+HOST = "127.0.0.1"
+PORT = 8765
+BATCH_MAX = 1000     # submissions committed together at most
+MAX_BODY = 64 * 1024
+
+# The page served at / for terminals that only have a browser
+FORM_PAGE = """<!doctype html>
+<html><head><meta charset="utf-8"><title>Meal Count</title></head>
+<body style="font-family: Helvetica, sans-serif; max-width: 420px; margin: 2em auto">
+<h2>Submit Today's Meal Count</h2>
+<form id="f">
+<p>Roll <input name="roll" required></p>
+<p>Name <input name="student" required></p>
+<p>Religion <select name="religion"><option>Hindu</option><option>Muslim</option><option>Aboriginal</option></select></p>
+<p>Prayer Done <select name="prayer_done"><option>Yes</option><option>No</option></select></p>
+<p>Meal Count <input name="meal_count" value="1"></p>
+<p>Meal Expenses <input name="meal_rate"></p>
+<p>Hostel (OT) <input name="hostel"> Electricity (OT) <input name="electricity"> Inventory (OT) <input name="inventory"></p>
+<button>Submit</button> <span id="msg"></span>
+</form>
+<script>
+const form = document.getElementById("f"), msg = document.getElementById("msg");
+async function send(confirmed) {
+  const body = Object.fromEntries(new FormData(form));
+  if (confirmed) body.confirm = true;
+  const reply = await (await fetch("/submit", {method: "POST", body: JSON.stringify(body),
+                                               headers: {"Content-Type": "application/json"}})).json();
+  if (reply.high_meal_count && !confirmed) {
+    if (confirm(reply.error + "\\nDo you want to proceed?")) return send(true);
+  } else if (reply.ok) {
+    msg.textContent = "Saved as record " + reply.serial; form.reset();
+  } else {
+    msg.textContent = reply.error;
+  }
+}
+form.onsubmit = (event) => { event.preventDefault(); send(false); };
+</script>
+</body></html>
+"""
+
+STATUS_TEXT = {200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed",
+               503: "Service Unavailable"}
+
+class Rejected(Exception):
+    # A submission that fails validation; the message is shown to the student
+    def __init__(self, message, **extra):
+        super().__init__(message)
+        self.extra = extra
+
+# ------------------- Validation -------------------
+def build_submission(fields):
+    # The checks add_expense() makes, in the same order and with the same
+    # messages. A meal count above MAX_USUAL_MEALS is refused unless the
+    # submission says "confirm", where the form would have asked.
+    try:
+        rec = build_expense(fields.get("roll"), fields.get("student"), fields.get("religion"),
+                            fields.get("prayer_done"), fields.get("meal_count"), fields.get("meal_rate"),
+                            fields.get("hostel"), fields.get("electricity"), fields.get("inventory"))
+    except ValueError as exc:
+        raise Rejected(str(exc)) from None
+    warning = meal_count_warning(fields.get("meal_count"))
+    if warning is not None and str(fields.get("confirm", "")).lower() not in ("1", "true", "yes"):
+        raise Rejected(warning, high_meal_count=True)
+    return rec
+
+def parse_body(body, content_type):
+    if content_type.startswith("application/x-www-form-urlencoded"):
+        return dict(parse_qsl(body.decode("utf-8")))
+    try:
+        fields = json.loads(body or b"{}")
+    except ValueError:
+        raise Rejected("Submissions must be a JSON object or a form post") from None
+    if not isinstance(fields, dict):
+        raise Rejected("Submissions must be a JSON object or a form post")
+    return fields
+
+# ------------------- Server -------------------
+class SubmissionServer:
+    # Takes submissions from many connections at once and commits them in
+    # groups: while one group is being saved, new submissions queue up and
+    # the next group takes all of them, so a burst near the deadline costs a
+    # few saves instead of one per student. A submission is answered only
+    # after its group is on disk.
+    def __init__(self, ledger, host=HOST, port=PORT, batch_max=BATCH_MAX):
+        self.ledger = ledger
+        self.host = host
+        self.port = port
+        self.batch_max = batch_max
+        self.queue = None
+        self.server = None
+        self.batcher = None
+        self.stats = {"accepted": 0, "rejected": 0, "batches": 0}
+
+    async def start(self):
+        self.queue = asyncio.Queue()
+        self.batcher = asyncio.create_task(self._commit_batches())
+        self.server = await asyncio.start_server(self._handle_connection, self.host, self.port)
+        self.port = self.server.sockets[0].getsockname()[1]  # the real one when started on port 0
+        return self
+
+    async def stop(self):
+        self.server.close()
+        await self.server.wait_closed()
+        await self.queue.join()  # answer whatever was already submitted
+        self.batcher.cancel()
+
+    async def submit(self, rec):
+        # Returns once rec is saved; raises the save error if the write failed
+        done = asyncio.get_running_loop().create_future()
+        await self.queue.put((rec, done))
+        return await done
+
+    async def _commit_batches(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self.queue.get()]
+            while len(batch) < self.batch_max and not self.queue.empty():
+                batch.append(self.queue.get_nowait())
+            records = [rec for rec, _ in batch]
+            try:
+                # insert_many() hands the batch to the ledger's writer; flush() waits for the save
+                await loop.run_in_executor(None, self.ledger.insert_many, records)
+                await loop.run_in_executor(None, self.ledger.flush)
+                failed = None
+            except Exception as exc:
+                failed = exc
+            if self.ledger.writer is not None:
+                self.ledger.writer.pop_errors()  # reported to each submission below
+            self.stats["batches"] += 1
+            for rec, done in batch:
+                if done.cancelled():
+                    pass
+                elif failed is None:
+                    done.set_result(rec.serial)
+                else:
+                    done.set_exception(failed)
+                self.queue.task_done()
+
+    async def _handle_connection(self, reader, writer):
+        try:
+            while True:
+                request = await self._read_request(reader)
+                if request is None:
+                    break
+                method, path, headers, body = request
+                status, content_type, payload = await self._route(method, path, headers, body)
+                keep_alive = headers.get("connection", "").lower() != "close"
+                writer.write(f"HTTP/1.1 {status} {STATUS_TEXT[status]}\r\n"
+                             f"Content-Type: {content_type}\r\nContent-Length: {len(payload)}\r\n"
+                             f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n".encode("latin-1")
+                             + payload)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+            pass  # the terminal went away or sent something that is not HTTP
+        finally:
+            writer.close()
+
+    @staticmethod
+    async def _read_request(reader):
+        line = await reader.readline()
+        if not line.strip():
+            return None
+        method, path, _ = line.decode("latin-1").split(" ", 2)
+        headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b"\r\n", b"\n", b""):
+                break
+            name, _, value = line.decode("latin-1").partition(":")
+            headers[name.strip().lower()] = value.strip()
+        length = int(headers.get("content-length") or 0)
+        if length > MAX_BODY:
+            raise ValueError("request body too large")
+        body = await reader.readexactly(length) if length else b""
+        return method.upper(), path.split("?", 1)[0], headers, body
+
+    async def _route(self, method, path, headers, body):
+        if path == "/" and method == "GET":
+            return 200, "text/html; charset=utf-8", FORM_PAGE.encode("utf-8")
+        if path == "/stats" and method == "GET":
+            return self._reply(200, dict(self.stats, queued=self.queue.qsize()))
+        if path != "/submit":
+            return self._reply(404, {"ok": False, "error": "Not found"})
+        if method != "POST":
+            return self._reply(405, {"ok": False, "error": "Use POST"})
+        try:
+            rec = build_submission(parse_body(body, headers.get("content-type", "")))
+        except Rejected as exc:
+            self.stats["rejected"] += 1
+            return self._reply(400, {"ok": False, "error": str(exc), **exc.extra})
+        try:
+            serial = await self.submit(rec)
+        except Exception as exc:
+            if rec.serial is None:
+                return self._reply(503, {"ok": False, "error": f"Could not save: {exc}"})
+            # The record stays in the ledger and its save is retried, so it must not be resubmitted
+            return self._reply(503, {"ok": False, "serial": rec.serial, "error": f"Accepted but not saved yet: {exc}"})
+        self.stats["accepted"] += 1
+        return self._reply(200, {"ok": True, "serial": serial, "meal_count": rec.meal_count,
+                                 "mess": rec.mess, "date": rec.date})
+
+    @staticmethod
+    def _reply(status, payload):
+        return status, "application/json", json.dumps(payload).encode("utf-8")
+
+# ------------------- Entry Point -------------------
+async def serve(ledger, host, port):
+    server = await SubmissionServer(ledger, host, port).start()
+    print(f"Taking meal counts on http://{server.host}:{server.port}/ (Ctrl+C to stop)", flush=True)
+    try:
+        await asyncio.Event().wait()  # until cancelled by Ctrl+C
+    finally:
+        await server.stop()
+        print(f"Stopped: {server.stats['accepted']} accepted, {server.stats['rejected']} rejected "
+              f"in {server.stats['batches']} saves")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Take meal counts from several terminals at once")
+    parser.add_argument("--ledger", default=FILE_PATH, help="ledger CSV (default: %(default)s)")
+    parser.add_argument("--storage", choices=["journal", "csv", "sqlite", "partitioned"],
+                        help="storage mode (default: HOSTEL_STORAGE or journal)")
+    parser.add_argument("--host", default=HOST, help="address to listen on (default: %(default)s, this PC only)")
+    parser.add_argument("--port", type=int, default=PORT, help="(default: %(default)s)")
+    args = parser.parse_args(argv)
+
+    try:
+        ledger = Ledger(args.ledger, args.storage).load()
+    except ValueError as exc:
+        print(exc, file=sys.stderr)  # unreadable rows; nothing was changed
+        return 1
+    ledger.start_writer()
+    try:
+        asyncio.run(serve(ledger, args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        try:
+            ledger.compact()
+        finally:
+            ledger.close()  # even when the last save fails
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
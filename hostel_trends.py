@@ -0,0 +1,119 @@
+from datetime import date
+
+np = None  # NumPy, imported by load_numpy() when trends are first asked for
+
+ROLLING_DAYS = 7
+TOP_N = 10
+METRICS = {"meals": "Meals", "mess": "Mess Cost", "penalty": "Prayer Penalty"}
+EPOCH = date(1970, 1, 1).toordinal()
+
+def load_numpy():
+    # Trends are optional and everything else works without NumPy, so it is
+    # not imported with this module (it would add ~100ms to the GUI's startup)
+    global np
+    if np is None:
+        try:
+            import numpy
+        except ImportError:
+            raise RuntimeError("Trend analytics need NumPy (pip install numpy)") from None
+        np = numpy
+    return np
+
+# ------------------- Column Arrays -------------------
+class TrendData:
+    # The ledger as parallel NumPy columns, one entry per record. Built in a
+    # single pass over the records and rebuilt only when ledger.revision
+    # moves; every series below is then bincount/cumsum work on the columns.
+    def __init__(self, ledger):
+        load_numpy()
+        self.ledger = ledger
+        self.revision = None
+
+    def refresh(self):
+        ledger = self.ledger
+        ledger.load_months()  # the whole history, in partitioned storage too
+        if self.revision == ledger.revision:
+            return self
+        with ledger.lock:
+            revision = ledger.revision
+            records = list(ledger.records.values())
+        codes = {}
+        count = len(records)
+        self.day = np.fromiter((rec.day for rec in records), np.int64, count)
+        self.roll = np.fromiter((codes.setdefault(rec.roll, len(codes)) for rec in records), np.int64, count)
+        self.meals = np.fromiter((rec.meal_count for rec in records), np.float64, count)
+        self.mess = np.fromiter((rec.mess for rec in records), np.float64, count)
+        no_prayer = np.fromiter((rec.prayer_done == "No" for rec in records), bool, count)
+        # Same rule as Expense.penalty: the extra meal charged when prayer was not done
+        self.penalty = np.where(no_prayer & (self.meals > 0), self.mess / np.maximum(self.meals, 1), 0.0)
+        # Months since 1970-01, so consecutive months are consecutive integers
+        self.month = (self.day - EPOCH).astype("datetime64[D]").astype("datetime64[M]").astype(np.int64)
+        self.rolls = list(codes)  # code -> roll
+        self.codes = codes
+        self.revision = revision
+        return self
+
+    def column(self, metric):
+        return {"meals": self.meals, "mess": self.mess, "penalty": self.penalty}[metric]
+
+    def select(self, roll=None, day_from=None, day_to=None):
+        # Boolean row mask, or None for every row
+        mask = None
+        if roll is not None:
+            code = self.codes.get(roll)
+            mask = self.roll == (-1 if code is None else code)
+        if day_from is not None:
+            mask = (self.day >= day_from) if mask is None else mask & (self.day >= day_from)
+        if day_to is not None:
+            mask = (self.day <= day_to) if mask is None else mask & (self.day <= day_to)
+        return mask
+
+# ------------------- Series -------------------
+def daily_series(data, metric, roll=None):
+    # (day ordinals, totals) for every day from the first to the last row, gaps as 0
+    mask = data.select(roll)
+    days = data.day if mask is None else data.day[mask]
+    values = data.column(metric) if mask is None else data.column(metric)[mask]
+    if not len(days):
+        return np.zeros(0, np.int64), np.zeros(0)
+    first = days.min()
+    totals = np.bincount(days - first, weights=values)
+    return np.arange(first, first + len(totals)), totals
+
+def monthly_series(data, metric, roll=None):
+    # (months since 1970-01, totals) for every month from the first to the last row
+    mask = data.select(roll)
+    months = data.month if mask is None else data.month[mask]
+    values = data.column(metric) if mask is None else data.column(metric)[mask]
+    if not len(months):
+        return np.zeros(0, np.int64), np.zeros(0)
+    first = months.min()
+    totals = np.bincount(months - first, weights=values)
+    return np.arange(first, first + len(totals)), totals
+
+def rolling_mean(values, window=ROLLING_DAYS):
+    # Mean of each value and the window - 1 before it (fewer at the start)
+    sums = np.cumsum(np.concatenate(([0.0], values)))
+    ends = np.arange(1, len(values) + 1)
+    starts = np.maximum(ends - window, 0)
+    return (sums[ends] - sums[starts]) / (ends - starts)
+
+def month_over_month(totals):
+    # Percent change against the month before; NaN where that month is 0
+    change = np.full(len(totals), np.nan)
+    previous = totals[:-1]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        change[1:] = np.where(previous != 0, (totals[1:] - previous) / previous * 100, np.nan)
+    return change
+
+def top_consumers(data, metric="meals", n=TOP_N, day_from=None, day_to=None):
+    # The n rolls with the highest total of metric in the range: [(roll, total)]
+    mask = data.select(None, day_from, day_to)
+    rolls = data.roll if mask is None else data.roll[mask]
+    values = data.column(metric) if mask is None else data.column(metric)[mask]
+    totals = np.bincount(rolls, weights=values, minlength=len(data.rolls))
+    order = np.argsort(-totals, kind="stable")[:n]
+    return [(data.rolls[code], float(totals[code])) for code in order if totals[code] > 0]
+
+def month_label(month):
+    return f"{1970 + int(month) // 12}-{int(month) % 12 + 1:02d}"
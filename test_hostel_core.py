@@ -0,0 +1,209 @@
+import os
+import threading
+import time
+from datetime import date
+
+import pytest
+
+from hostel_core import MAX_USUAL_MEALS, Ledger, build_expense, export_changes, meal_count_warning
+
+def make(roll, meals=1):
+    return build_expense(roll, f"Student {roll}", "Hindu", "Yes", meals, "35", "", "", "")
+
+@pytest.fixture
+def ledger(tmp_path):
+    ledger = Ledger(str(tmp_path / "student_expense.csv"), "csv").load()
+    yield ledger
+    ledger.close()
+
+# ------------------- Expense Rules -------------------
+def test_meal_count_checked_the_same_everywhere():
+    with pytest.raises(ValueError, match="Enter a valid number for meal count!"):
+        build_expense("1", "Student 1", "Hindu", "Yes", "two", "35")
+    assert build_expense("1", "Student 1", "Hindu", "No", " ", "35").meal_count == 2  # blank is one meal
+    assert meal_count_warning(str(MAX_USUAL_MEALS)) is None
+    assert meal_count_warning(MAX_USUAL_MEALS + 1) == f"Meal count is {MAX_USUAL_MEALS + 1}, which is unusually high."
+
+# ------------------- Background Saving -------------------
+def test_flush_while_another_thread_submits(ledger, monkeypatch):
+    # A change submitted while flush() waits on a write is left for the next
+    # batch; flush() must not treat it as a failed write
+    ledger.start_writer(delay=0.01)
+    write = ledger._write_changes
+    calls = []
+
+    def write_with_submit(changes, rows):
+        if not calls:
+            calls.append(changes)
+            other = threading.Thread(target=ledger.insert, args=(make("2"),))
+            other.start()
+            other.join()
+        write(changes, rows)
+
+    monkeypatch.setattr(ledger, "_write_changes", write_with_submit)
+    ledger.insert(make("1"))
+    ledger.flush()
+    ledger.flush()
+    assert not ledger.writer.pop_errors()
+    assert sorted(rec.roll for rec in Ledger(ledger.file_path, "csv").load().records.values()) == ["1", "2"]
+
+def test_flush_raises_the_write_error(ledger, monkeypatch):
+    ledger.start_writer(delay=0.01)
+
+    def fail(changes, rows):
+        raise OSError("disk full")
+
+    monkeypatch.setattr(ledger, "_write_changes", fail)
+    ledger.insert(make("1"))
+    with pytest.raises(OSError, match="disk full"):
+        ledger.flush()
+    monkeypatch.undo()
+    ledger.flush()  # retried, and nothing was lost
+    assert [rec.roll for rec in Ledger(ledger.file_path, "csv").load().records.values()] == ["1"]
+
+def test_flush_after_a_merge_dropped_every_queued_change(ledger, monkeypatch):
+    first = ledger.insert(make("1"))
+    other = Ledger(ledger.file_path, "csv").load()
+    ledger.start_writer(delay=0.01)
+
+    def fail(changes, rows):
+        raise OSError("disk full")
+
+    monkeypatch.setattr(ledger, "_write_changes", fail)
+    ledger.replace(first.serial, make("1", 2))
+    with pytest.raises(OSError):
+        ledger.flush()  # the edit stays queued and the writer goes idle
+    monkeypatch.undo()
+    other.replace(first.serial, make("1", 3))  # saved first, so it wins
+    ledger.sync()
+    ledger.flush()  # nothing is left to write
+    assert ledger.pop_conflicts() == [first.serial]
+    assert ledger.records[first.serial].meal_count == 3
+    other.close()
+
+# ------------------- Summary Cache -------------------
+def test_summary_not_cached_across_a_concurrent_change(ledger, monkeypatch):
+    first = ledger.insert(make("1"))
+    query = ledger.query
+    calls = []
+
+    def query_with_insert(*args, **kwargs):
+        rows = query(*args, **kwargs)
+        if not calls:
+            calls.append(args)
+            ledger.insert(make("1"))  # lands after the rows were read
+        return rows
+
+    monkeypatch.setattr(ledger, "query", query_with_insert)
+    day = date.fromordinal(first.day)
+    assert ledger.month_summary("1", day.year, day.month)[5] == 1
+    assert ledger.month_summary("1", day.year, day.month)[5] == 2
+
+# ------------------- Other Processes -------------------
+def test_writer_takes_in_other_saves(ledger):
+    ledger.start_writer(delay=0.01, sync_every=0.02)
+    other = Ledger(ledger.file_path, "csv").load()
+    other.insert(make("7"))
+    deadline = time.monotonic() + 5
+    while not ledger.merges and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert [rec.roll for rec in ledger.records.values()] == ["7"]
+    other.close()
+
+def test_insert_not_held_up_by_reading_other_saves(ledger, monkeypatch):
+    ledger.start_writer(delay=0.01)
+    other = Ledger(ledger.file_path, "csv").load()
+    other.insert(make("7"))
+    foreign = ledger._foreign_changes
+    reading, release = threading.Event(), threading.Event()
+
+    def slow_foreign_changes():
+        reading.set()
+        release.wait(5)  # a long re-read of a large ledger
+        return foreign()
+
+    monkeypatch.setattr(ledger, "_foreign_changes", slow_foreign_changes)
+    syncing = threading.Thread(target=ledger.sync)
+    syncing.start()
+    assert reading.wait(5)
+    started = time.monotonic()
+    ledger.insert(make("1"))
+    assert time.monotonic() - started < 1
+    release.set()
+    syncing.join()
+    ledger.flush()
+    assert sorted(rec.roll for rec in ledger.records.values()) == ["1", "7"]
+    other.close()
+
+def test_save_noticed_when_size_and_mtime_did_not_change(ledger):
+    first = ledger.insert(make("1"))
+    other = Ledger(ledger.file_path, "csv").load()
+    paths = [ledger.file_path, ledger.journal_path]
+    before = {path: os.stat(path) for path in paths}
+    other.replace(first.serial, make("1", 2))  # same width, so the same size
+    for path, stat in before.items():
+        assert os.path.getsize(path) == stat.st_size
+        os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns))  # as on a coarse-mtime file system
+    assert ledger.sync()
+    assert ledger.records[first.serial].meal_count == 2
+    other.close()
+
+# ------------------- Loading -------------------
+def test_load_that_renumbers_makes_the_next_export_full(ledger, tmp_path):
+    first = ledger.insert(make("1"))
+    ledger.insert(make("2"))
+    out_dir = str(tmp_path / "exports")
+    assert export_changes(ledger, out_dir)["kind"] == "full"
+    ledger.close()
+    row = make("3").to_row()
+    row[0] = first.serial  # a copied row, as older ledgers had after deletes
+    with open(ledger.file_path, "a", encoding="utf-8") as f:
+        f.write(",".join(map(str, row)) + "\n")
+    reloaded = Ledger(ledger.file_path, "csv").load()  # the copied serial is renumbered
+    assert len(reloaded.records) == 3
+    assert export_changes(reloaded, out_dir)["kind"] == "full"
+    reloaded.close()
+
+def test_load_refuses_unreadable_rows(ledger):
+    ledger.insert(make("1"))
+    ledger.insert(make("2"))
+    ledger.close()
+    with open(ledger.file_path, "a", encoding="utf-8") as f:
+        f.write("3,Student 3,Student 3,not a date,Hindu,Yes,1,35,0,0,0\n")
+    with open(ledger.file_path, "rb") as f:
+        before = f.read()
+    with pytest.raises(ValueError, match="1 unreadable rows \\(line 4\\)"):
+        Ledger(ledger.file_path, "csv").load()
+    with open(ledger.file_path, "rb") as f:
+        assert f.read() == before  # nothing was rewritten
+
+@pytest.mark.parametrize("storage", ["journal", "csv", "sqlite", "partitioned"])
+def test_deleted_newest_serial_not_reused_after_restart(tmp_path, storage):
+    path = str(tmp_path / "student_expense.csv")
+    ledger = Ledger(path, storage).load()
+    ledger.insert(make("1"))
+    newest = ledger.insert(make("2")).serial
+    ledger.remove(newest)
+    ledger.close()
+    ledger = Ledger(path, storage).load()
+    assert ledger.insert(make("3")).serial > newest
+    ledger.close()
+
+# ------------------- Incremental Export -------------------
+def test_change_log_kept_only_as_far_back_as_an_export_needs(ledger, tmp_path):
+    ledger.insert(make("1"))
+    assert not os.path.exists(ledger.changes_path)  # nobody exports yet
+    first, second = str(tmp_path / "first"), str(tmp_path / "second")
+    assert export_changes(ledger, first)["kind"] == "full"
+    assert export_changes(ledger, second)["kind"] == "full"
+    ledger.insert(make("2"))
+    ledger.insert(make("3"))
+    assert export_changes(ledger, first)["upserts"] == 2
+    ledger.insert(make("4"))
+    with open(ledger.changes_path, "rb") as f:
+        assert len(f.readlines()) == 4  # the header and what second has not exported
+    batch = export_changes(ledger, second)
+    assert (batch["kind"], batch["upserts"]) == ("changes", 3)
+    assert export_changes(ledger, first)["upserts"] == 1
+    with open(ledger.changes_path, "rb") as f:
+        assert len(f.readlines()) == 1